@@ -0,0 +1,120 @@
+import threading
+
+import numpy as np
+
+CONDITIONS = ('<', '>', '<=', '>=')
+
+_EMPTY_THRESHOLDS = np.empty(0, dtype=np.float64)
+_EMPTY_IDS = np.empty(0, dtype=np.int64)
+
+
+def _compile(pairs):
+    # Sorted thresholds with the alert ids in the same order
+    pairs = sorted(pairs)
+    thresholds = np.array([threshold for threshold, _ in pairs], dtype=np.float64)
+    alert_ids = np.array([alert_id for _, alert_id in pairs], dtype=np.int64)
+    return thresholds, alert_ids
+
+
+class AlertIndex:
+    # All alerts in memory, grouped by window and condition as sorted threshold
+    # arrays, so a reading is checked with a binary search instead of a query
+
+    def __init__(self):
+        self._windows = {}  # window_id -> {condition: (thresholds, alert_ids)}
+        self._lock = threading.Lock()
+        self.loaded = False
+
+    def ensure_loaded(self, loader):
+        # loader returns (alert_id, window_id, threshold_value, condition) rows
+        with self._lock:
+            if not self.loaded:
+                self._windows = self._build(loader())
+                self.loaded = True
+
+    def _build(self, alerts):
+        grouped = {}
+        for alert_id, window_id, threshold_value, condition in alerts:
+            grouped.setdefault(window_id, {}).setdefault(condition, []).append((float(threshold_value), alert_id))
+
+        return {window_id: {condition: _compile(pairs) for condition, pairs in conditions.items()}
+                for window_id, conditions in grouped.items()}
+
+    def add(self, alert_id, window_id, threshold_value, condition):
+        with self._lock:
+            # Not loaded yet, the alert will be picked up by the first load
+            if not self.loaded:
+                return
+
+            conditions = self._windows.setdefault(window_id, {})
+            thresholds, alert_ids = conditions.get(condition, (_EMPTY_THRESHOLDS, _EMPTY_IDS))
+            # A load that ran after the alert was committed already has it
+            if alert_id in alert_ids:
+                return
+
+            position = np.searchsorted(thresholds, threshold_value, side='right')
+            conditions[condition] = (np.insert(thresholds, position, threshold_value),
+                                     np.insert(alert_ids, position, alert_id))
+
+    def replace_windows(self, window_ids, alerts):
+        # Rebuild the given windows from fresh (alert_id, window_id, threshold_value, condition) rows
+        with self._lock:
+            if not self.loaded:
+                return
+
+            for window_id in window_ids:
+                self._windows.pop(window_id, None)
+            self._windows.update(self._build(alerts))
+
+    def evaluate(self, readings):
+        # readings are (window_id, value) pairs, returns every alert they trigger
+        values_by_window = {}
+        for window_id, value in readings:
+            if value is not None:
+                values_by_window.setdefault(window_id, []).append(float(value))
+
+        triggered = []
+        with self._lock:
+            for window_id, values in values_by_window.items():
+                conditions = self._windows.get(window_id)
+                if not conditions:
+                    continue
+
+                values = np.array(values, dtype=np.float64)
+                for condition, (thresholds, alert_ids) in conditions.items():
+                    for value, hits in zip(values, self._hits(condition, thresholds, values)):
+                        for index in hits:
+                            triggered.append({
+                                'alert_id': int(alert_ids[index]),
+                                'window_id': window_id,
+                                'condition': condition,
+                                'threshold_value': float(thresholds[index]),
+                                'value': float(value),
+                            })
+        return triggered
+
+    def threshold_margin(self, window_id, value):
+        # Distance from value to the window's closest threshold, relative to that
+        # threshold. None when the window has no alerts
+        closest = None
+        with self._lock:
+            for thresholds, _ in self._windows.get(window_id, {}).values():
+                position = np.searchsorted(thresholds, value)
+                for threshold in thresholds[max(0, position - 1):position + 1]:
+                    margin = abs(value - threshold) / max(abs(threshold), 1.0)
+                    closest = margin if closest is None else min(closest, margin)
+        return None if closest is None else float(closest)
+
+    def _hits(self, condition, thresholds, values):
+        # Index ranges into the sorted thresholds that each value satisfies
+        count = len(thresholds)
+        if condition == '>':
+            # value > threshold for every threshold strictly below the value
+            return [range(0, end) for end in np.searchsorted(thresholds, values, side='left')]
+        if condition == '>=':
+            return [range(0, end) for end in np.searchsorted(thresholds, values, side='right')]
+        if condition == '<':
+            return [range(start, count) for start in np.searchsorted(thresholds, values, side='right')]
+        if condition == '<=':
+            return [range(start, count) for start in np.searchsorted(thresholds, values, side='left')]
+        return [range(0)] * len(values)
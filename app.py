@@ -1,17 +1,114 @@
-from flask import request, jsonify
-from werkzeug.security import generate_password_hash, check_password_hash
+from flask import request, jsonify, Request, Response
 from flask_sqlalchemy import SQLAlchemy
 from flask import Flask
 from flask_jwt_extended import JWTManager, create_access_token, jwt_required, get_jwt_identity
-from datetime import datetime
+from datetime import datetime, timedelta
 from flask_cors import CORS
+from sqlalchemy.orm import selectinload
+import atexit
+import hmac
+import io
+import os
+import threading
+import time
+
+from alert_index import AlertIndex
+import database
+from etags import CollectionVersions
+from ingest import IngestDaemon, stream_url_error
+from events import EventBroker, format_event
+from ownership import OwnershipCache
+from passwords import DEFAULT_METHOD as DEFAULT_PASSWORD_HASH_METHOD, PasswordHasher, HasherBusy
+import readings
+from scheduler import SamplingScheduler
+from model import decode, ocr
+from model.pool import OCRPool, PoolSaturated, JobTimeout
+from model.batching import CropBatcher
+from model.change_gate import ChangeGate
+from model.proposals import ProposalCache, propose_windows
+from notifications import AlertTracker, WebhookDispatcher
+
+
+
+class InMemoryRequest(Request):
+    # Keep uploaded frames in memory, werkzeug spools uploads over 500KB to temp files
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        return io.BytesIO()
+
 
 app = Flask(__name__)
+app.request_class = InMemoryRequest
 CORS(app)
 
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///db.sqlite3'
+# Defaults to the local SQLite file, point DATABASE_URL at a server database to switch
+app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('DATABASE_URL', 'sqlite:///db.sqlite3')
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+app.config['SQLALCHEMY_ENGINE_OPTIONS'] = database.engine_options(
+    app.config['SQLALCHEMY_DATABASE_URI'],
+    pool_size=int(os.environ.get('DB_POOL_SIZE', 10)),
+    max_overflow=int(os.environ.get('DB_MAX_OVERFLOW', 20)),
+    pool_recycle=int(os.environ.get('DB_POOL_RECYCLE', 1800)),
+    busy_timeout=float(os.environ.get('SQLITE_BUSY_TIMEOUT', 5)))
+database.configure_sqlite(synchronous=os.environ.get('SQLITE_SYNCHRONOUS', 'NORMAL'),
+                          busy_timeout_ms=float(os.environ.get('SQLITE_BUSY_TIMEOUT', 5)) * 1000)
 app.config['JWT_SECRET_KEY'] = 'Key' # Placeholder for now
+# Uploads are held in memory, so cap their size (a 1080p frame is well under this)
+app.config['MAX_CONTENT_LENGTH'] = int(os.environ.get('MAX_CONTENT_LENGTH', 16 * 1024 * 1024))
+app.config['OCR_ENGINE'] = os.environ.get('OCR_ENGINE', 'easyocr') # easyocr, tesseract, digits or onnx
+app.config['OCR_ONNX_MODEL'] = os.environ.get('OCR_ONNX_MODEL', 'model/recognizer.int8.onnx')
+app.config['OCR_ONNX_THREADS'] = int(os.environ.get('OCR_ONNX_THREADS', 1))
+app.config['OCR_TESSDATA'] = os.environ.get('OCR_TESSDATA') # tessdata directory, tesseract's default when unset
+app.config['OCR_POOL_SIZE'] = int(os.environ.get('OCR_POOL_SIZE', 2))
+app.config['OCR_QUEUE_DEPTH'] = int(os.environ.get('OCR_QUEUE_DEPTH', 8))
+app.config['OCR_JOB_TIMEOUT'] = float(os.environ.get('OCR_JOB_TIMEOUT', 10))
+app.config['OCR_BATCH_SIZE'] = int(os.environ.get('OCR_BATCH_SIZE', 16))
+app.config['OCR_BATCH_WAIT'] = float(os.environ.get('OCR_BATCH_WAIT', 0.01))
+app.config['OCR_PREPROCESS'] = os.environ.get('OCR_PREPROCESS', '1') == '1'
+app.config['OCR_PREPROCESS_HEIGHT'] = int(os.environ.get('OCR_PREPROCESS_HEIGHT', 48))
+app.config['OCR_MONTAGE'] = os.environ.get('OCR_MONTAGE', '0') == '1' # One detect pass per batch of crops
+app.config['OCR_MONTAGE_PADDING'] = float(os.environ.get('OCR_MONTAGE_PADDING', 1.0)) # Gap between crops, share of the tallest
+app.config['OCR_CHANGE_TOLERANCE'] = float(os.environ.get('OCR_CHANGE_TOLERANCE', 3.0))
+app.config['OCR_REFRESH_INTERVAL'] = float(os.environ.get('OCR_REFRESH_INTERVAL', 30))
+app.config['SCHEDULER_MIN_INTERVAL'] = float(os.environ.get('SCHEDULER_MIN_INTERVAL', 1))
+app.config['SCHEDULER_MAX_INTERVAL'] = float(os.environ.get('SCHEDULER_MAX_INTERVAL', 30))
+# Crops per second the OCR pool may spend across all cameras
+app.config['SCHEDULER_CROP_BUDGET'] = float(os.environ.get('SCHEDULER_CROP_BUDGET', app.config['OCR_POOL_SIZE'] * 20))
+app.config['SCHEDULER_PROXIMITY_RANGE'] = float(os.environ.get('SCHEDULER_PROXIMITY_RANGE', 0.2))
+app.config['SCHEDULER_VOLATILITY_RANGE'] = float(os.environ.get('SCHEDULER_VOLATILITY_RANGE', 0.05))
+app.config['INGEST_ENABLED'] = os.environ.get('INGEST_ENABLED', '0') == '1'
+app.config['INGEST_WORKERS'] = int(os.environ.get('INGEST_WORKERS', app.config['OCR_POOL_SIZE']))
+app.config['INGEST_MAX_FRAME_AGE'] = float(os.environ.get('INGEST_MAX_FRAME_AGE', 2))
+app.config['INGEST_REFRESH_INTERVAL'] = float(os.environ.get('INGEST_REFRESH_INTERVAL', 30))
+# Lets stream URLs be local video files, only for tests and demos
+app.config['INGEST_ALLOW_FILES'] = os.environ.get('INGEST_ALLOW_FILES', '0') == '1'
+# Comma separated URLs that get a POST when an alert starts or stops firing
+app.config['ALERT_WEBHOOKS'] = [url.strip() for url in os.environ.get('ALERT_WEBHOOKS', '').split(',') if url.strip()]
+app.config['ALERT_MIN_DURATION'] = float(os.environ.get('ALERT_MIN_DURATION', 5)) # Seconds triggered before firing
+app.config['ALERT_CLEAR_DURATION'] = float(os.environ.get('ALERT_CLEAR_DURATION', 5)) # Seconds cleared before resolving
+app.config['ALERT_HYSTERESIS'] = float(os.environ.get('ALERT_HYSTERESIS', 0.02)) # Share of the threshold
+app.config['ALERT_WEBHOOK_WORKERS'] = int(os.environ.get('ALERT_WEBHOOK_WORKERS', 2))
+app.config['ALERT_WEBHOOK_TIMEOUT'] = float(os.environ.get('ALERT_WEBHOOK_TIMEOUT', 5))
+app.config['ALERT_WEBHOOK_RETRIES'] = int(os.environ.get('ALERT_WEBHOOK_RETRIES', 3))
+app.config['ALERT_WEBHOOK_BACKOFF'] = float(os.environ.get('ALERT_WEBHOOK_BACKOFF', 1))
+app.config['ALERT_DEAD_LETTER_PATH'] = os.environ.get('ALERT_DEAD_LETTER_PATH', 'instance/alert_dead_letter.jsonl')
+app.config['PROPOSAL_REDUCE'] = int(os.environ.get('PROPOSAL_REDUCE', 1)) # 1, 2, 4 or 8
+app.config['PROPOSAL_TIMEOUT'] = float(os.environ.get('PROPOSAL_TIMEOUT', 60))
+app.config['PROPOSAL_MIN_CONFIDENCE'] = float(os.environ.get('PROPOSAL_MIN_CONFIDENCE', 0.3))
+app.config['READINGS_FLUSH_SIZE'] = int(os.environ.get('READINGS_FLUSH_SIZE', 500))
+app.config['READINGS_FLUSH_INTERVAL'] = float(os.environ.get('READINGS_FLUSH_INTERVAL', 5))
+app.config['READINGS_RAW_RETENTION_HOURS'] = float(os.environ.get('READINGS_RAW_RETENTION_HOURS', 48))
+app.config['READINGS_MINUTE_RETENTION_DAYS'] = float(os.environ.get('READINGS_MINUTE_RETENTION_DAYS', 30))
+app.config['READINGS_MAX_POINTS'] = int(os.environ.get('READINGS_MAX_POINTS', 5000))
+app.config['STREAM_HISTORY_SIZE'] = int(os.environ.get('STREAM_HISTORY_SIZE', 500))
+app.config['STREAM_QUEUE_SIZE'] = int(os.environ.get('STREAM_QUEUE_SIZE', 100))
+app.config['STREAM_KEEPALIVE'] = float(os.environ.get('STREAM_KEEPALIVE', 15))
+app.config['OWNERSHIP_CACHE_SIZE'] = int(os.environ.get('OWNERSHIP_CACHE_SIZE', 1024))
+app.config['BULK_MAX_ITEMS'] = int(os.environ.get('BULK_MAX_ITEMS', 1000))
+app.config['PAGE_SIZE'] = int(os.environ.get('PAGE_SIZE', 100))
+app.config['PASSWORD_HASH_METHOD'] = os.environ.get('PASSWORD_HASH_METHOD', DEFAULT_PASSWORD_HASH_METHOD)
+app.config['PASSWORD_HASH_WORKERS'] = int(os.environ.get('PASSWORD_HASH_WORKERS', 2))
+app.config['PASSWORD_HASH_QUEUE'] = int(os.environ.get('PASSWORD_HASH_QUEUE', 16))
+app.config['MAX_PAGE_SIZE'] = int(os.environ.get('MAX_PAGE_SIZE', 500))
 
 db = SQLAlchemy(app)
 jwt = JWTManager(app)
@@ -28,13 +125,15 @@ class User(db.Model):
 class Camera(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     token = db.Column(db.String(50), unique=True, nullable=False)
-    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=True, index=True)
     name = db.Column(db.String(50), nullable=True)
+    # RTSP/HTTP stream or video file the ingestion daemon reads frames from
+    stream_url = db.Column(db.String(500), nullable=True)
     windows = db.relationship('Window', backref='camera')
 
 class Window(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    camera_id = db.Column(db.Integer, db.ForeignKey('camera.id'), nullable=False)
+    camera_id = db.Column(db.Integer, db.ForeignKey('camera.id'), nullable=False, index=True)
     name = db.Column(db.String(50), nullable=False)
     top_left_x = db.Column(db.Integer, nullable=False)
     top_left_y = db.Column(db.Integer, nullable=False)
@@ -43,13 +142,173 @@ class Window(db.Model):
 
 class Alert(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    window_id = db.Column(db.Integer, db.ForeignKey('window.id'), nullable=False)
+    window_id = db.Column(db.Integer, db.ForeignKey('window.id'), nullable=False, index=True)
     threshold_value = db.Column(db.Float, nullable=False)
     condition = db.Column(db.String(20), nullable=False)  # e.g., '<', '>', '<=', '>='
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
     window = db.relationship('Window', backref='alerts')
 
+class Reading(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    window_id = db.Column(db.Integer, db.ForeignKey('window.id'), nullable=False)
+    value = db.Column(db.Float, nullable=False)
+    timestamp = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    __table_args__ = (db.Index('ix_reading_window_timestamp', 'window_id', 'timestamp'),)
+
+class ReadingRollup(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    window_id = db.Column(db.Integer, db.ForeignKey('window.id'), nullable=False)
+    resolution = db.Column(db.String(8), nullable=False)  # '1m' or '1h'
+    bucket = db.Column(db.DateTime, nullable=False)  # Start of the minute/hour
+    min_value = db.Column(db.Float, nullable=False)
+    max_value = db.Column(db.Float, nullable=False)
+    total = db.Column(db.Float, nullable=False)
+    count = db.Column(db.Integer, nullable=False)
+
+    __table_args__ = (db.UniqueConstraint('window_id', 'resolution', 'bucket'),)
+
+# Which cameras and windows each user owns, so routes can authorize without queries
+ownership = OwnershipCache(lambda user_id: db.session.query(Camera.id, Window.id)
+                                             .outerjoin(Window, Window.camera_id == Camera.id)
+                                             .filter(Camera.user_id == user_id).all(),
+                           max_users=app.config['OWNERSHIP_CACHE_SIZE'])
+
+# Password hashing runs off the request threads, with a cap on waiting work
+password_hasher = PasswordHasher(method=app.config['PASSWORD_HASH_METHOD'],
+                                 workers=app.config['PASSWORD_HASH_WORKERS'],
+                                 max_pending=app.config['PASSWORD_HASH_QUEUE'])
+
+def hasher_busy_response():
+    response = jsonify({'message': 'Server is busy, try again shortly'})
+    response.headers['Retry-After'] = '1'
+    return response, 503 # Service Unavailable
+
+# Per-collection versions behind the ETags of the list endpoints
+collection_versions = CollectionVersions()
+
+def page_args():
+    # Keyset cursor from ?after=<last id>&limit=, raises ValueError when invalid
+    after = int(request.args.get('after', 0))
+    limit = min(int(request.args.get('limit', app.config['PAGE_SIZE'])), app.config['MAX_PAGE_SIZE'])
+    if after < 0 or limit < 1:
+        raise ValueError('Invalid page')
+    return after, limit
+
+def not_modified(etag):
+    # 304 response when the client already has this version of the list
+    if request.if_none_match.contains(etag):
+        response = app.response_class(status=304)
+        response.set_etag(etag)
+        return response
+    return None
+
+def page_response(name, rows, limit, format_row, etag):
+    # rows holds up to limit + 1 items, the extra one only tells there is a next page
+    next_cursor = rows[limit - 1].id if len(rows) > limit else None
+    response = jsonify({name: [format_row(row) for row in rows[:limit]], 'next_cursor': next_cursor})
+    response.set_etag(etag)
+    return response, 200
+
+def current_user_id():
+    # The token is signed and verified by jwt_required, so its subject is trusted as is
+    return int(get_jwt_identity())
+
+# Alerts are evaluated from memory, loaded from the database on first use
+alert_index = AlertIndex()
+
+def get_alert_index():
+    alert_index.ensure_loaded(lambda: db.session.query(Alert.id, Alert.window_id,
+                                                       Alert.threshold_value, Alert.condition).all())
+    return alert_index
+
+# New readings and triggered alerts are pushed to the owner's open streams
+event_broker = EventBroker(history_size=app.config['STREAM_HISTORY_SIZE'],
+                           queue_size=app.config['STREAM_QUEUE_SIZE'])
+
+# Readings are buffered in memory and written in bulk together with their rollups
+reading_buffer = readings.ReadingBuffer(max_size=app.config['READINGS_FLUSH_SIZE'],
+                                        max_age=app.config['READINGS_FLUSH_INTERVAL'])
+_flush_lock = threading.Lock()
+_last_prune = 0.0
+
+def flush_readings():
+    with _flush_lock:
+        points = reading_buffer.drain()
+        if not points:
+            return
+
+        try:
+            db.session.bulk_insert_mappings(Reading, [
+                {'window_id': window_id, 'value': value, 'timestamp': timestamp}
+                for window_id, value, timestamp in points])
+
+            # Merge the new points into the existing minute and hour buckets
+            aggregates = readings.rollup(points)
+            existing = ReadingRollup.query.filter(
+                ReadingRollup.window_id.in_({key[0] for key in aggregates}),
+                ReadingRollup.bucket.in_({key[2] for key in aggregates})).all()
+            existing = {(row.window_id, row.resolution, row.bucket): row for row in existing}
+
+            for key, (min_value, max_value, total, count) in aggregates.items():
+                row = existing.get(key)
+                if row is None:
+                    db.session.add(ReadingRollup(window_id=key[0], resolution=key[1], bucket=key[2],
+                                                 min_value=min_value, max_value=max_value,
+                                                 total=total, count=count))
+                else:
+                    row.min_value = min(row.min_value, min_value)
+                    row.max_value = max(row.max_value, max_value)
+                    row.total += total
+                    row.count += count
+
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            print('Failed to flush readings', e)
+
+def prune_readings(windows_per_commit=100):
+    # One window at a time, so every delete is a range on the (window_id,
+    # timestamp) index instead of a scan of the whole table, committed in
+    # small batches so flushes aren't locked out for the whole prune
+    now = datetime.utcnow()
+    raw_cutoff = now - timedelta(hours=app.config['READINGS_RAW_RETENTION_HOURS'])
+    minute_cutoff = now - timedelta(days=app.config['READINGS_MINUTE_RETENTION_DAYS'])
+
+    window_ids = [window_id for window_id, in db.session.query(Window.id).order_by(Window.id)]
+    for start in range(0, len(window_ids), windows_per_commit):
+        try:
+            for window_id in window_ids[start:start + windows_per_commit]:
+                Reading.query.filter(Reading.window_id == window_id,
+                                     Reading.timestamp < raw_cutoff).delete(synchronize_session=False)
+                ReadingRollup.query.filter(ReadingRollup.window_id == window_id,
+                                           ReadingRollup.resolution == '1m',
+                                           ReadingRollup.bucket < minute_cutoff).delete(synchronize_session=False)
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            print('Failed to prune readings', e)
+            return
+
+def maintain_readings():
+    # Runs on the reading flusher's thread, old raw points and minute
+    # buckets are pruned every few minutes
+    global _last_prune
+    with app.app_context():
+        flush_readings()
+        if time.monotonic() - _last_prune > 600:
+            _last_prune = time.monotonic()
+            prune_readings()
+
+reading_flusher = readings.ReadingFlusher(maintain_readings, interval=app.config['READINGS_FLUSH_INTERVAL'])
+
+def _flush_readings_on_exit():
+    reading_flusher.stop(timeout=30)
+    with app.app_context():
+        flush_readings()
+
+atexit.register(_flush_readings_on_exit)
     
 @app.route('/register', methods=['POST'])
 def register():
@@ -70,7 +329,10 @@ def register():
         return jsonify({'message': 'Email is already associated with a user.'})
     
     # Create new user
-    hashed_password = generate_password_hash(password, method='pbkdf2:sha256')
+    try:
+        hashed_password = password_hasher.hash(password)
+    except HasherBusy:
+        return hasher_busy_response()
     new_user = User(username=username, email=email, password=hashed_password)
 
     try:
@@ -94,8 +356,24 @@ def login():
 
     user = User.query.filter_by(username=username).first()
 
-    if user and check_password_hash(user.password, password):
-        access_token = create_access_token(identity=user.id)
+    try:
+        valid = user is not None and password_hasher.verify(user.password, password)
+    except HasherBusy:
+        return hasher_busy_response()
+
+    # Upgrade hashes made with an older method or work factor while we have the password
+    if valid and password_hasher.needs_rehash(user.password):
+        try:
+            user.password = password_hasher.hash(password)
+            db.session.commit()
+        except Exception as e:
+            # Not fatal, the old hash still works and is upgraded on a later login
+            db.session.rollback()
+            print('Failed to rehash password', e)
+
+    if valid:
+        access_token = create_access_token(identity=str(user.id),
+                                           additional_claims={'username': user.username})
         return jsonify({
                         'message': 'Login success.',
                         'access_token': access_token}), 200
@@ -122,11 +400,8 @@ def pair_camera():
         return jsonify({'message': 'Camera name is required'}), 400
 
     # Get the user identity from JWT token
-    user_id = get_jwt_identity()
-    user = User.query.get(user_id)
-    if not user:
-        return jsonify({'message': 'Unauthorized access'}), 401
-    
+    user_id = current_user_id()
+
     # Find the camera by token
 
     camera = Camera.query.filter_by(token=camera_token).first()
@@ -136,10 +411,13 @@ def pair_camera():
         return jsonify({'message': 'Camera is already paired'}), 409  # Conflict if already paired
 
     # Pair camera with the user and set the name
-    camera.user_id = user.id
+    camera.user_id = user_id
     camera.name = name
     try:
         db.session.commit()
+        ownership.invalidate(user_id)
+        collection_versions.bump('cameras', user_id)
+        proposal_cache.forget(camera.id)
         return jsonify({'message': 'Camera paired successfully', 'camera': {'id': camera.id, 'name': camera.name}}), 200
     except Exception as e:
         db.session.rollback()
@@ -149,66 +427,97 @@ def pair_camera():
 @app.route('/cameras', methods=['GET'])
 @jwt_required()
 def get_cameras():
-    # Get the username (or user identifier) from the JWT token
-    user = User.query.get(get_jwt_identity())
-    
-    # Validate if the user exists
-    if not user:
-        return jsonify({'message': 'Unauthorized access'}), 401
+    # Get the user identifier from the JWT token
+    user_id = current_user_id()
+
+    try:
+        after, limit = page_args()
+    except ValueError:
+        return jsonify({'message': 'Invalid page'}), 400
+
+    etag = collection_versions.etag('cameras', user_id, after, limit)
+    cached = not_modified(etag)
+    if cached:
+        return cached
+
+    # Retrieve the next page of cameras associated with the user
+    cameras = (Camera.query.filter(Camera.user_id == user_id, Camera.id > after)
+               .order_by(Camera.id).limit(limit + 1).all())
 
-    # Retrieve all cameras associated with the user
-    cameras = Camera.query.filter_by(user_id=user.id).all()
-    
     # Format the camera data
-    cameras_data = []
-    for camera in cameras:
-        camera_info = {
+    def camera_info(camera):
+        return {
             'id': camera.id,
             'name': camera.name,
         }
-        cameras_data.append(camera_info)
 
-    return jsonify({'cameras': cameras_data}), 200
+    return page_response('cameras', cameras, limit, camera_info, etag)
 
 
 
 
 
-@app.route('/add_window', methods=['POST'])
-@jwt_required()
-def add_window():
-    existing_user = User.query.get(get_jwt_identity())
-    data = request.get_json()
+WINDOW_COORDINATES = ('top_left_x', 'top_left_y', 'bottom_right_x', 'bottom_right_y')
+
+def parse_window_data(data):
+    # Returns (window fields, None) when valid, otherwise (None, error message)
+    if not isinstance(data, dict):
+        return None, 'Invalid data'
 
-    # Check if user exists
-    if not existing_user:
-        return jsonify({'message': 'Unauthorized access'}), 401
-    
     name = data.get('name')
-    top_left_x = data.get('top_left_x')
-    top_left_y = data.get('top_left_y')
-    bottom_right_x = data.get('bottom_right_x')
-    bottom_right_y = data.get('bottom_right_y')
     camera_id = data.get('camera_id')
+    if not (name and camera_id and all(data.get(key) is not None for key in WINDOW_COORDINATES)):
+        return None, 'Invalid data'
 
-    if not (name and top_left_x is not None and top_left_y is not None and 
-            bottom_right_x is not None and bottom_right_y is not None and camera_id):
-        return jsonify({'message': 'Invalid data'}), 400
-    
-    camera = Camera.query.get(camera_id)
+    try:
+        fields = {key: int(data[key]) for key in WINDOW_COORDINATES}
+        fields['camera_id'] = int(camera_id)
+    except (TypeError, ValueError):
+        return None, 'Invalid data'
+    fields['name'] = name
+    return fields, None
+
+def parse_alert_data(data):
+    # Returns (alert fields, None) when valid, otherwise (None, error message)
+    if not isinstance(data, dict):
+        return None, 'Invalid data'
+
+    threshold_value = data.get('threshold_value')
+    condition = data.get('condition')
+    if threshold_value is None or condition not in ['<', '>', '<=', '>=']:
+        return None, 'Invalid data'
 
-    if not camera or camera.user_id != existing_user.id:
+    try:
+        threshold_value = float(threshold_value)
+    except (TypeError, ValueError):
+        return None, 'Invalid data'
+    return {'threshold_value': threshold_value, 'condition': condition}, None
+
+def bulk_response(created, errors, item_name):
+    # 201 when everything was created, 207 for partial success, 400 when nothing was
+    if not created:
+        return jsonify({'message': f'No {item_name} created', 'created': 0, 'errors': errors}), 400
+    status = 207 if errors else 201
+    return jsonify({'message': f'{created} {item_name} created', 'created': created, 'errors': errors}), status
+
+@app.route('/add_window', methods=['POST'])
+@jwt_required()
+def add_window():
+    user_id = current_user_id()
+
+    fields, error = parse_window_data(request.get_json())
+    if error:
+        return jsonify({'message': error}), 400
+
+    if not ownership.owns_camera(user_id, fields['camera_id']):
         return jsonify({'message': 'Camera not found or not owned by user'}), 400
     
-    new_window = Window(camera_id=camera_id,
-                        name=name,
-                        top_left_x=top_left_x,
-                        top_left_y=top_left_y,
-                        bottom_right_x=bottom_right_x,
-                        bottom_right_y=bottom_right_y)
+    new_window = Window(**fields)
     try:
         db.session.add(new_window)
         db.session.commit()
+        ownership.invalidate(user_id)
+        collection_versions.bump('windows', fields['camera_id'])
 
         return jsonify({'message': 'Window created successfully'}), 201
     
@@ -216,28 +525,74 @@ def add_window():
         db.session.rollback()
         return jsonify({'message': 'Failed to create window', 'error': str(e)}), 500 # Internal Server Error
 
+def insert_windows(user_id, rows):
+    # Insert already validated window rows in one transaction
+    db.session.bulk_insert_mappings(Window, rows)
+    db.session.commit()
+    ownership.invalidate(user_id)
+    for camera_id in {row['camera_id'] for row in rows}:
+        collection_versions.bump('windows', camera_id)
+
+# Endpoint to create many windows (across any of the user's cameras) in one transaction
+@app.route('/windows/bulk', methods=['POST'])
+@jwt_required()
+def add_windows_bulk():
+    user_id = current_user_id()
+    data = request.get_json()
+
+    items = data.get('windows') if isinstance(data, dict) else None
+    if not isinstance(items, list) or not items:
+        return jsonify({'message': 'Invalid data'}), 400
+    if len(items) > app.config['BULK_MAX_ITEMS']:
+        return jsonify({'message': f'At most {app.config["BULK_MAX_ITEMS"]} windows per request'}), 413
+
+    # Every camera is checked against the same ownership lookup
+    camera_ids, _ = ownership.get(user_id)
+
+    rows = []
+    errors = []
+    for index, item in enumerate(items):
+        fields, error = parse_window_data(item)
+        if not error and fields['camera_id'] not in camera_ids:
+            error = 'Camera not found or not owned by user'
+        if error:
+            errors.append({'index': index, 'message': error})
+        else:
+            rows.append(fields)
+
+    if rows:
+        try:
+            insert_windows(user_id, rows)
+        except Exception as e:
+            db.session.rollback()
+            return jsonify({'message': 'Failed to create windows', 'error': str(e)}), 500
+
+    return bulk_response(len(rows), errors, 'windows')
+
 @app.route('/cameras/<int:camera_id>/windows', methods=['GET'])
 @jwt_required()
 def get_windows(camera_id):
-    # Get the user from the JWT token
-    existing_user = User.query.get(get_jwt_identity())
-    
-    # Validate if the user exists
-    if not existing_user:
-        return jsonify({'message': 'Unauthorized access'}), 401
-
     # Check if the camera exists and belongs to the user
-    camera = Camera.query.filter_by(id=camera_id, user_id=existing_user.id).first()
-    if not camera:
+    if not ownership.owns_camera(current_user_id(), camera_id):
         return jsonify({'message': 'Camera not found or not owned by user'}), 404
 
-    # Retrieve all windows associated with the specified camera
-    windows = Window.query.filter_by(camera_id=camera_id).all()
+    try:
+        after, limit = page_args()
+    except ValueError:
+        return jsonify({'message': 'Invalid page'}), 400
+
+    etag = collection_versions.etag('windows', camera_id, after, limit)
+    cached = not_modified(etag)
+    if cached:
+        return cached
+
+    # Retrieve the next page of windows associated with the specified camera
+    windows = (Window.query.filter(Window.camera_id == camera_id, Window.id > after)
+               .order_by(Window.id).limit(limit + 1).all())
     
     # Format the window data
-    windows_data = []
-    for window in windows:
-        window_info = {
+    def window_info(window):
+        return {
             'id': window.id,
             'name': window.name,
             'top_left_x': window.top_left_x,
@@ -245,9 +600,8 @@ def get_windows(camera_id):
             'bottom_right_x': window.bottom_right_x,
             'bottom_right_y': window.bottom_right_y,
         }
-        windows_data.append(window_info)
 
-    return jsonify({'windows': windows_data}), 200
+    return page_response('windows', windows, limit, window_info, etag)
 
 
 
@@ -255,67 +609,616 @@ def get_windows(camera_id):
 @app.route('/windows/<int:window_id>/alerts', methods=['POST'])
 @jwt_required()
 def create_alert(window_id):
-    # Get the user from JWT token
-    existing_user = User.query.get(get_jwt_identity())
-    if not existing_user:
-        return jsonify({'message': 'Unauthorized access'}), 401
-
     # Check if the window exists and belongs to the user
-    window = Window.query.get(window_id)
-    if not window or window.camera.user_id != existing_user.id:
+    if not ownership.owns_window(current_user_id(), window_id):
         return jsonify({'message': 'Window not found or not owned by user'}), 404
 
-    data = request.get_json()
-    threshold_value = data.get('threshold_value')
-    condition = data.get('condition')
-
     # Validate the input data
-    if threshold_value is None or condition not in ['<', '>', '<=', '>=']:
-        return jsonify({'message': 'Invalid data'}), 400
+    fields, error = parse_alert_data(request.get_json())
+    if error:
+        return jsonify({'message': error}), 400
 
     # Create a new alert
-    new_alert = Alert(window_id=window_id,
-                      threshold_value=threshold_value,
-                      condition=condition)
+    new_alert = Alert(window_id=window_id, **fields)
     try:
         db.session.add(new_alert)
         db.session.commit()
+        alert_index.add(new_alert.id, window_id, fields['threshold_value'], fields['condition'])
+        collection_versions.bump('alerts', window_id)
         return jsonify({'message': 'Alert created successfully'}), 201
     except Exception as e:
         db.session.rollback()
         return jsonify({'message': 'Failed to create alert', 'error': str(e)}), 500
 
 
+# Endpoint to create many alerts (across any of the user's windows) in one transaction
+@app.route('/alerts/bulk', methods=['POST'])
+@jwt_required()
+def create_alerts_bulk():
+    user_id = current_user_id()
+    data = request.get_json()
+
+    items = data.get('alerts') if isinstance(data, dict) else None
+    if not isinstance(items, list) or not items:
+        return jsonify({'message': 'Invalid data'}), 400
+    if len(items) > app.config['BULK_MAX_ITEMS']:
+        return jsonify({'message': f'At most {app.config["BULK_MAX_ITEMS"]} alerts per request'}), 413
+
+    # Every window is checked against the same ownership lookup
+    _, window_ids = ownership.get(user_id)
+
+    rows = []
+    errors = []
+    for index, item in enumerate(items):
+        fields, error = parse_alert_data(item)
+        if not error:
+            try:
+                fields['window_id'] = int(item.get('window_id'))
+            except (TypeError, ValueError):
+                error = 'Invalid data'
+        if not error and fields['window_id'] not in window_ids:
+            error = 'Window not found or not owned by user'
+        if error:
+            errors.append({'index': index, 'message': error})
+        else:
+            rows.append(fields)
+
+    if rows:
+        try:
+            db.session.bulk_insert_mappings(Alert, rows)
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            return jsonify({'message': 'Failed to create alerts', 'error': str(e)}), 500
+
+        # Bulk inserts don't hand back ids, so reload the touched windows into the index
+        touched = {row['window_id'] for row in rows}
+        for window_id in touched:
+            collection_versions.bump('alerts', window_id)
+        alert_index.replace_windows(touched, db.session.query(Alert.id, Alert.window_id,
+                                                              Alert.threshold_value, Alert.condition)
+                                               .filter(Alert.window_id.in_(touched)).all())
+
+    return bulk_response(len(rows), errors, 'alerts')
+
+
 # Endpoint to retrieve alerts for a specific window
 @app.route('/windows/<int:window_id>/alerts', methods=['GET'])
 @jwt_required()
 def get_alerts(window_id):
-    # Get the user from the JWT token
-    existing_user = User.query.get(get_jwt_identity())
-    if not existing_user:
-        return jsonify({'message': 'Unauthorized access'}), 401
-
     # Check if the window exists and belongs to the user
-    window = Window.query.get(window_id)
-    if not window or window.camera.user_id != existing_user.id:
+    if not ownership.owns_window(current_user_id(), window_id):
         return jsonify({'message': 'Window not found or not owned by user'}), 404
 
-    # Retrieve all alerts associated with the specified window
-    alerts = Alert.query.filter_by(window_id=window_id).all()
-    print(len(alerts))
+    try:
+        after, limit = page_args()
+    except ValueError:
+        return jsonify({'message': 'Invalid page'}), 400
+
+    etag = collection_versions.etag('alerts', window_id, after, limit)
+    cached = not_modified(etag)
+    if cached:
+        return cached
+
+    # Retrieve the next page of alerts associated with the specified window
+    alerts = (Alert.query.filter(Alert.window_id == window_id, Alert.id > after)
+              .order_by(Alert.id).limit(limit + 1).all())
 
     # Format the alert data
-    alerts_data = []
-    for alert in alerts:
-        alert_info = {
+    def alert_info(alert):
+        return {
             'id': alert.id,
             'threshold_value': alert.threshold_value,
             'condition': alert.condition,
             'created_at': alert.created_at.isoformat()
         }
-        alerts_data.append(alert_info)
 
-    return jsonify({'alerts': alerts_data}), 200
+    return page_response('alerts', alerts, limit, alert_info, etag)
+
+
+# OCR workers keep a warm engine each, the pool is started on first use
+_ocr_pool = None
+_ocr_pool_lock = threading.Lock()
+
+def get_ocr_pool():
+    global _ocr_pool
+    with _ocr_pool_lock:
+        if _ocr_pool is None:
+            engine_options = {}
+            if app.config['OCR_ENGINE'] == 'onnx':
+                engine_options = {'model_path': app.config['OCR_ONNX_MODEL'],
+                                  'threads': app.config['OCR_ONNX_THREADS']}
+            elif app.config['OCR_ENGINE'] == 'tesseract':
+                engine_options = {'tessdata': app.config['OCR_TESSDATA']}
+            _ocr_pool = OCRPool(app.config['OCR_ENGINE'],
+                                size=app.config['OCR_POOL_SIZE'],
+                                queue_depth=app.config['OCR_QUEUE_DEPTH'],
+                                timeout=app.config['OCR_JOB_TIMEOUT'],
+                                batch_size=app.config['OCR_BATCH_SIZE'],
+                                engine_options=engine_options,
+                                preprocess_options={'height': app.config['OCR_PREPROCESS_HEIGHT']}
+                                if app.config['OCR_PREPROCESS'] else None,
+                                montage_options={'padding': app.config['OCR_MONTAGE_PADDING']}
+                                if app.config['OCR_MONTAGE'] else None)
+            atexit.register(_ocr_pool.shutdown)
+    return _ocr_pool
+
+# Crops from concurrent frame uploads are recognized together in batches
+_crop_batcher = None
+
+def get_crop_batcher():
+    global _crop_batcher
+    pool = get_ocr_pool()
+    with _ocr_pool_lock:
+        if _crop_batcher is None:
+            _crop_batcher = CropBatcher(pool,
+                                        batch_size=app.config['OCR_BATCH_SIZE'],
+                                        max_wait=app.config['OCR_BATCH_WAIT'])
+    return _crop_batcher
+
+# Unchanged window crops reuse their last reading instead of being OCR'd again
+change_gate = ChangeGate(tolerance=app.config['OCR_CHANGE_TOLERANCE'],
+                         refresh_interval=app.config['OCR_REFRESH_INTERVAL'])
+
+
+# Cameras near an alert threshold or changing quickly are asked for frames more often
+scheduler = SamplingScheduler(min_interval=app.config['SCHEDULER_MIN_INTERVAL'],
+                              max_interval=app.config['SCHEDULER_MAX_INTERVAL'],
+                              budget=app.config['SCHEDULER_CROP_BUDGET'],
+                              proximity_range=app.config['SCHEDULER_PROXIMITY_RANGE'],
+                              volatility_range=app.config['SCHEDULER_VOLATILITY_RANGE'])
+
+# Alerts that stay triggered become notifications, delivered to the webhooks in the background
+alert_tracker = AlertTracker(min_duration=app.config['ALERT_MIN_DURATION'],
+                             clear_duration=app.config['ALERT_CLEAR_DURATION'],
+                             hysteresis=app.config['ALERT_HYSTERESIS'])
+alert_dispatcher = WebhookDispatcher(app.config['ALERT_WEBHOOKS'],
+                                     workers=app.config['ALERT_WEBHOOK_WORKERS'],
+                                     timeout=app.config['ALERT_WEBHOOK_TIMEOUT'],
+                                     retries=app.config['ALERT_WEBHOOK_RETRIES'],
+                                     backoff=app.config['ALERT_WEBHOOK_BACKOFF'],
+                                     dead_letter_path=app.config['ALERT_DEAD_LETTER_PATH'])
+atexit.register(alert_dispatcher.stop)
+
+
+def process_frame(camera, windows, frame):
+    # OCR the camera's windows in a decoded frame, then evaluate, publish and
+    # store the readings. Shared by frame uploads and the ingestion daemon,
+    # OCR errors (PoolSaturated, JobTimeout, ...) are left to the caller
+    boxes = [ocr.window_box(window) for window in windows]
+    items = ocr.crop_windows(frame.image, decode.frame_boxes(frame, boxes))
+
+    # Only crops that changed since their last reading go to OCR
+    results = {}
+    fingerprints = {}
+    changed_items = []
+    for window_id, crop in items:
+        fingerprint, cached = change_gate.check(window_id, crop)
+        if cached is not None:
+            results[window_id] = dict(cached, cached=True)
+        else:
+            fingerprints[window_id] = fingerprint
+            changed_items.append((window_id, crop))
+
+    batcher = get_crop_batcher()
+    new_results = batcher.result(batcher.submit(changed_items))
+
+    for window_id, result in new_results.items():
+        change_gate.update(window_id, fingerprints[window_id], result)
+        results[window_id] = dict(result, cached=False)
+
+    # Format the reading data, windows outside the frame get no value
+    readings_data = []
+    for window in windows:
+        result = results.get(window.id, {})
+        reading_info = {
+            'window_id': window.id,
+            'name': window.name,
+            'value': result.get('value'),
+            'text': result.get('text'),
+            'confidence': result.get('confidence'),
+            'cached': result.get('cached', False),
+        }
+        readings_data.append(reading_info)
+
+    index = get_alert_index()
+    triggered_alerts = index.evaluate(
+        (reading['window_id'], reading['value']) for reading in readings_data)
+
+    # Triggered windows count as right on their threshold
+    triggered_windows = {alert['window_id'] for alert in triggered_alerts}
+    margins = {reading['window_id']: 0.0 if reading['window_id'] in triggered_windows
+               else index.threshold_margin(reading['window_id'], reading['value'])
+               for reading in readings_data if reading['value'] is not None}
+    next_interval = scheduler.observe(camera.id, [(reading['window_id'], reading['value']) for reading in readings_data],
+                                      margins, crops=len(changed_items))
+
+    event_broker.publish(camera.user_id, 'readings', {'camera_id': camera.id, 'readings': readings_data})
+    for alert in triggered_alerts:
+        event_broker.publish(camera.user_id, 'alert', dict(alert, camera_id=camera.id))
+
+    # One notification per window whose alerts started or stopped firing
+    window_names = {reading['window_id']: reading['name'] for reading in readings_data}
+    changes = alert_tracker.observe(((reading['window_id'], reading['value']) for reading in readings_data),
+                                    triggered_alerts)
+    for window_id, change in changes.items():
+        notification = {
+            'camera_id': camera.id,
+            'camera_name': camera.name,
+            'window_id': window_id,
+            'window_name': window_names.get(window_id),
+            'firing': change['firing'],
+            'resolved': change['resolved'],
+            'timestamp': datetime.utcnow().isoformat(),
+        }
+        alert_dispatcher.submit(notification)
+        event_broker.publish(camera.user_id, 'notification', notification)
+
+    # Buffer the readings, the flusher thread writes them in the background
+    # and is woken early once enough have been buffered
+    timestamp = datetime.utcnow()
+    should_flush = False
+    for reading in readings_data:
+        if reading['value'] is not None:
+            should_flush = reading_buffer.add(reading['window_id'], reading['value'], timestamp) or should_flush
+    reading_flusher.start()
+    if should_flush:
+        reading_flusher.wake()
+
+    return {'readings': readings_data, 'alerts': triggered_alerts, 'next_interval': next_interval}
+
+
+# Endpoint for cameras to upload a frame, only the window regions are OCR'd
+@app.route('/cameras/<int:camera_id>/frames', methods=['POST'])
+def upload_frame(camera_id):
+    # Cameras authenticate with their own token instead of a user JWT
+    token = request.headers.get('X-Camera-Token') or request.form.get('token')
+    camera = Camera.query.get(camera_id)
+    if not camera or not token or not hmac.compare_digest(camera.token.encode(), token.encode()):
+        return jsonify({'message': 'Unauthorized camera'}), 401
+    if not camera.user_id:
+        return jsonify({'message': 'Camera is not paired'}), 409
+
+    # Accept either a multipart file upload or the raw image as the request body
+    frame = request.files.get('frame')
+    data = frame.read() if frame else request.get_data()
+    if not data:
+        return jsonify({'message': 'Frame is required'}), 400
+
+    # Only the part of the frame covering the camera's windows is decoded
+    windows = Window.query.filter_by(camera_id=camera.id).all()
+    frame = decode.decode(data, region=decode.bounding_region([ocr.window_box(window) for window in windows]))
+    if frame is None:
+        return jsonify({'message': 'Could not decode frame'}), 400
+
+    try:
+        result = process_frame(camera, windows, frame)
+    except PoolSaturated:
+        return jsonify({'message': 'OCR is busy, try again later'}), 503 # Service Unavailable
+    except JobTimeout:
+        return jsonify({'message': 'OCR timed out'}), 504 # Gateway Timeout
+    except Exception as e:
+        return jsonify({'message': 'Failed to read frame', 'error': str(e)}), 500
+
+    return jsonify(result), 200
+
+
+# Pulls frames from cameras that have a stream_url instead of waiting for uploads
+def _ingest_sources():
+    with app.app_context():
+        cameras = Camera.query.filter(Camera.user_id.isnot(None), Camera.stream_url.isnot(None)).all()
+        return {camera.id: camera.stream_url for camera in cameras}
+
+def _ingest_frame(camera_id, image):
+    with app.app_context():
+        camera = Camera.query.get(camera_id)
+        if not camera or not camera.user_id:
+            return
+        windows = Window.query.filter_by(camera_id=camera.id).all()
+        process_frame(camera, windows, decode.Frame(image, (0, 0), 1))
+
+ingest_daemon = IngestDaemon(_ingest_sources, _ingest_frame, scheduler.interval,
+                             workers=app.config['INGEST_WORKERS'],
+                             max_age=app.config['INGEST_MAX_FRAME_AGE'],
+                             refresh_interval=app.config['INGEST_REFRESH_INTERVAL'],
+                             allow_files=app.config['INGEST_ALLOW_FILES'],
+                             on_stop=scheduler.forget)
+
+# Endpoint to set (or clear with null) the stream the server pulls a camera's frames from
+@app.route('/cameras/<int:camera_id>/stream', methods=['PUT'])
+@jwt_required()
+def set_camera_stream(camera_id):
+    if not ownership.owns_camera(current_user_id(), camera_id):
+        return jsonify({'message': 'Camera not found or not owned by user'}), 404
+
+    data = request.get_json()
+    stream_url = data.get('stream_url') if isinstance(data, dict) else None
+    if stream_url is not None and (not isinstance(stream_url, str) or not stream_url.strip()):
+        return jsonify({'message': 'Invalid data'}), 400
+    if stream_url:
+        error = stream_url_error(stream_url.strip(), allow_files=app.config['INGEST_ALLOW_FILES'])
+        if error:
+            return jsonify({'message': error}), 400
+
+    camera = Camera.query.get(camera_id)
+    camera.stream_url = stream_url.strip() if stream_url else None
+    try:
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'message': 'Failed to update camera', 'error': str(e)}), 500
+
+    # The old stream's urgency and cost say nothing about the new one
+    scheduler.forget(camera_id)
+
+    if ingest_daemon.running:
+        ingest_daemon.refresh()
+    return jsonify({'message': 'Camera stream updated', 'stream_url': camera.stream_url}), 200
+
+
+# Fields that can be selected for each level of the account tree
+TREE_FIELDS = {
+    'camera': ('name',),
+    'window': ('name', 'top_left_x', 'top_left_y', 'bottom_right_x', 'bottom_right_y'),
+    'alert': ('threshold_value', 'condition', 'created_at'),
+}
+
+def _tree_node(obj, fields):
+    node = {'id': obj.id}
+    for field in fields:
+        value = getattr(obj, field)
+        node[field] = value.isoformat() if isinstance(value, datetime) else value
+    return node
+
+# Endpoint to retrieve all cameras with their windows and alerts in one request
+@app.route('/tree', methods=['GET'])
+@jwt_required()
+def get_tree():
+    user_id = current_user_id()
+
+    # Optional ?fields=camera.name,window.name,alert.condition (ids are always included)
+    selected = {level: fields for level, fields in TREE_FIELDS.items()}
+    if request.args.get('fields'):
+        selected = {level: [] for level in TREE_FIELDS}
+        for field in request.args['fields'].split(','):
+            level, _, name = field.strip().partition('.')
+            if level not in TREE_FIELDS or name not in TREE_FIELDS[level]:
+                return jsonify({'message': f'Invalid field: {field}'}), 400
+            selected[level].append(name)
+
+    # One query per level instead of one per camera and window
+    cameras = (Camera.query.filter_by(user_id=user_id)
+               .options(selectinload(Camera.windows).selectinload(Window.alerts))
+               .order_by(Camera.id).all())
+
+    cameras_data = []
+    for camera in cameras:
+        camera_info = _tree_node(camera, selected['camera'])
+        camera_info['windows'] = []
+        for window in sorted(camera.windows, key=lambda window: window.id):
+            window_info = _tree_node(window, selected['window'])
+            window_info['alerts'] = [_tree_node(alert, selected['alert'])
+                                     for alert in sorted(window.alerts, key=lambda alert: alert.id)]
+            camera_info['windows'].append(window_info)
+        cameras_data.append(camera_info)
+
+    return jsonify({'cameras': cameras_data}), 200
+
+
+# Endpoint to retrieve stored readings for a window, served from the rollup
+# tier that fits the requested range
+@app.route('/windows/<int:window_id>/readings', methods=['GET'])
+@jwt_required()
+def get_readings(window_id):
+    # Check if the window exists and belongs to the user
+    if not ownership.owns_window(current_user_id(), window_id):
+        return jsonify({'message': 'Window not found or not owned by user'}), 404
+
+    # Default to the last hour
+    now = datetime.utcnow()
+    try:
+        end = readings.parse_timestamp(request.args['to']) if request.args.get('to') else now
+        start = readings.parse_timestamp(request.args['from']) if request.args.get('from') else end - timedelta(hours=1)
+    except ValueError:
+        return jsonify({'message': 'Invalid from/to timestamp'}), 400
+    if start > end:
+        return jsonify({'message': 'from must be before to'}), 400
+
+    resolution = request.args.get('resolution', 'auto')
+    if resolution == 'auto':
+        raw_retention = timedelta(hours=app.config['READINGS_RAW_RETENTION_HOURS'])
+        resolution = readings.pick_resolution(start, end, now, raw_retention)
+    if resolution != 'raw' and resolution not in readings.RESOLUTIONS:
+        return jsonify({'message': 'Invalid resolution'}), 400
+
+    max_points = app.config['READINGS_MAX_POINTS']
+    readings_data = []
+    if resolution == 'raw':
+        points = Reading.query.filter(Reading.window_id == window_id,
+                                      Reading.timestamp >= start,
+                                      Reading.timestamp <= end).order_by(Reading.timestamp).limit(max_points).all()
+        for point in points:
+            readings_data.append({'timestamp': point.timestamp.isoformat(), 'value': point.value})
+    else:
+        buckets = ReadingRollup.query.filter(ReadingRollup.window_id == window_id,
+                                             ReadingRollup.resolution == resolution,
+                                             ReadingRollup.bucket >= readings.bucket_start(start, resolution),
+                                             ReadingRollup.bucket <= end).order_by(ReadingRollup.bucket).limit(max_points).all()
+        for bucket in buckets:
+            readings_data.append({
+                'timestamp': bucket.bucket.isoformat(),
+                'min': bucket.min_value,
+                'max': bucket.max_value,
+                'avg': bucket.total / bucket.count,
+                'count': bucket.count,
+            })
+
+    return jsonify({'resolution': resolution, 'readings': readings_data}), 200
+
+
+# Server-Sent Events stream of readings and alerts for all of the user's cameras
+@app.route('/stream', methods=['GET'])
+@jwt_required(locations=['headers', 'query_string']) # Browsers' EventSource can't set headers
+def stream_events():
+    user_id = current_user_id()
+
+    # Reconnecting clients resume after the last event they saw. Ids from an
+    # earlier server run can't be resumed, those clients get a reset event
+    raw_event_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+    last_event_id = event_broker.parse_id(raw_event_id)
+    subscription = event_broker.subscribe(user_id, last_event_id, reset=bool(raw_event_id) and last_event_id is None)
+    keepalive = app.config['STREAM_KEEPALIVE']
+
+    def generate():
+        try:
+            yield 'retry: 3000\n\n'
+            while True:
+                events = subscription.next_events(timeout=keepalive)
+                if not events:
+                    # Comment line keeps proxies from closing an idle connection
+                    yield ': keep-alive\n\n'
+                for event_id, event_type, data in events:
+                    yield format_event(event_broker.format_id(event_id), event_type, data)
+        finally:
+            event_broker.unsubscribe(subscription)
+
+    return Response(generate(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+
+# Detection runs once per reference frame, the result is kept per camera until replaced
+proposal_cache = ProposalCache()
+
+# Endpoint to propose windows from one reference frame of the camera
+@app.route('/cameras/<int:camera_id>/proposals', methods=['POST'])
+@jwt_required()
+def create_proposals(camera_id):
+    if not ownership.owns_camera(current_user_id(), camera_id):
+        return jsonify({'message': 'Camera not found or not owned by user'}), 404
+
+    frame = request.files.get('frame')
+    data = frame.read() if frame else request.get_data()
+    if not data:
+        return jsonify({'message': 'Frame is required'}), 400
+
+    # Detection can run on a reduced frame, boxes are scaled back to full size
+    decoded = decode.decode(data, reduce=app.config['PROPOSAL_REDUCE'])
+    if decoded is None:
+        return jsonify({'message': 'Could not decode frame'}), 400
+
+    pool = get_ocr_pool()
+    try:
+        detections = pool.result(pool.submit_detect(decoded.image), timeout=app.config['PROPOSAL_TIMEOUT'])
+    except PoolSaturated:
+        return jsonify({'message': 'OCR is busy, try again later'}), 503 # Service Unavailable
+    except JobTimeout:
+        return jsonify({'message': 'Detection timed out'}), 504 # Gateway Timeout
+    except NotImplementedError:
+        return jsonify({'message': f'The {app.config["OCR_ENGINE"]} engine cannot detect text'}), 501
+    except Exception as e:
+        return jsonify({'message': 'Failed to detect text', 'error': str(e)}), 500
+
+    scale = decoded.scale
+    detections = [((left * scale, top * scale, right * scale, bottom * scale), text, confidence)
+                  for (left, top, right, bottom), text, confidence in detections]
+    height, width = decoded.image.shape[:2]
+    frame_size = (width * scale, height * scale)
+    proposals = propose_windows(detections, frame_size, min_confidence=app.config['PROPOSAL_MIN_CONFIDENCE'])
+
+    return jsonify(proposal_cache.put(camera_id, frame_size, proposals)), 201
+
+# Endpoint to get the last proposals made for a camera
+@app.route('/cameras/<int:camera_id>/proposals', methods=['GET'])
+@jwt_required()
+def get_proposals(camera_id):
+    if not ownership.owns_camera(current_user_id(), camera_id):
+        return jsonify({'message': 'Camera not found or not owned by user'}), 404
+
+    entry = proposal_cache.get(camera_id)
+    if not entry:
+        return jsonify({'message': 'No proposals for this camera'}), 404
+    return jsonify(entry), 200
+
+# Endpoint to turn chosen proposals into windows, e.g. {"proposals": [{"index": 0, "name": "HR"}]}
+@app.route('/cameras/<int:camera_id>/proposals/accept', methods=['POST'])
+@jwt_required()
+def accept_proposals(camera_id):
+    user_id = current_user_id()
+    if not ownership.owns_camera(user_id, camera_id):
+        return jsonify({'message': 'Camera not found or not owned by user'}), 404
+
+    entry = proposal_cache.get(camera_id)
+    if not entry:
+        return jsonify({'message': 'No proposals for this camera'}), 404
+
+    data = request.get_json()
+    items = data.get('proposals') if isinstance(data, dict) else None
+    if not isinstance(items, list) or not items:
+        return jsonify({'message': 'Invalid data'}), 400
+
+    proposals = entry['proposals']
+    rows = []
+    errors = []
+    for index, item in enumerate(items):
+        chosen = item.get('index') if isinstance(item, dict) else None
+        if not isinstance(chosen, int) or not 0 <= chosen < len(proposals):
+            errors.append({'index': index, 'message': 'Unknown proposal'})
+            continue
+
+        proposal = proposals[chosen]
+        fields, error = parse_window_data({
+            'name': item.get('name') or proposal['name'],
+            'camera_id': camera_id,
+            **{key: proposal[key] for key in WINDOW_COORDINATES},
+        })
+        if error:
+            errors.append({'index': index, 'message': error})
+        else:
+            rows.append(fields)
+
+    if rows:
+        try:
+            insert_windows(user_id, rows)
+        except Exception as e:
+            db.session.rollback()
+            return jsonify({'message': 'Failed to create windows', 'error': str(e)}), 500
+
+    return bulk_response(len(rows), errors, 'windows')
+
+
+# Endpoint to inspect the sampling interval of each of the user's cameras
+@app.route('/schedule', methods=['GET'])
+@jwt_required()
+def get_schedule():
+    camera_ids, _ = ownership.get(current_user_id())
+    return jsonify(scheduler.schedule(camera_ids)), 200
+
+
+# Endpoint to see how much OCR work the change gate is saving
+@app.route('/ocr/stats', methods=['GET'])
+@jwt_required()
+def get_ocr_stats():
+    camera_ids, _ = ownership.get(current_user_id())
+    return jsonify({'change_gate': change_gate.stats(), 'ingest': ingest_daemon.stats(camera_ids),
+                    'notifications': alert_dispatcher.stats()}), 200
+
+
+# Endpoint to list the user's alerts that are currently firing
+@app.route('/alerts/firing', methods=['GET'])
+@jwt_required()
+def get_firing_alerts():
+    _, window_ids = ownership.get(current_user_id())
+    return jsonify({'alerts': alert_tracker.firing(window_ids)}), 200
+
+
+# Create missing tables and bring existing databases up to the current schema
+def upgrade_database():
+    db.create_all()
+    return database.upgrade(db.engine, db.metadata)
+
+@app.cli.command('db-upgrade')
+def db_upgrade_command():
+    print('Applied migrations', upgrade_database())
 
 
 @app.route('/test', methods=['GET'])
@@ -325,10 +1228,24 @@ def test():
 if __name__ == '__main__':
     try:
         with app.app_context():
-            db.create_all()
+            applied = upgrade_database()
+            if applied:
+                print('Applied migrations', applied)
     except Exception as e:
         print('Server oops', e)
 
+    # The debug reloader runs this file twice, only its child process serves requests
+    if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        # Warm every OCR worker before the first frame arrives
+        try:
+            get_ocr_pool().start()
+        except Exception as e:
+            print('Failed to start OCR workers', e)
+
+        if app.config['INGEST_ENABLED']:
+            ingest_daemon.start()
+            atexit.register(ingest_daemon.stop)
+
     app.run(host="0.0.0.0", port=5000, debug=True) 
 
 
@@ -0,0 +1,312 @@
+# HTTP load test for app.py. Seeds a throwaway database, drives the routes from
+# concurrent clients and prints throughput and p50/p95/p99 per endpoint as JSON.
+#
+#   python -m benchmarks.http_load --users 10 --cameras 4 --windows 6 --alerts 3 --threads 8 --duration 20
+#   python -m benchmarks.http_load --url http://127.0.0.1:5000 ...   (server must use the same DATABASE_URL)
+#
+# Every route is driven except GET /stream, a server sent events connection
+# that stays open for the whole session, so it has no per request latency.
+# POST /cameras/<id>/frames and the proposal routes need a frame (--frame), the
+# proposals only come back when OCR_ENGINE can detect text (501 otherwise).
+# PUT /cameras/<id>/stream sets an unreachable rtsp URL and clears it again, a
+# server running the ingest daemon starts and stops a reader for it each time
+import argparse
+import itertools
+import json
+import os
+import random
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+
+PASSWORD = 'password'
+BENCH_STREAM_URL = 'rtsp://127.0.0.1:9/bench'
+
+
+class TestClient:
+    # Flask test client, no network or server involved
+    def __init__(self, app):
+        self.client = app.test_client()
+
+    def request(self, method, path, headers=None, json=None, data=None):
+        response = self.client.open(path, method=method, headers=headers, json=json, data=data)
+        return response.status_code, response.get_json(silent=True), response.headers
+
+
+class HttpClient:
+    # Real HTTP against a running server, one keep-alive session per thread
+    def __init__(self, base_url):
+        import requests
+
+        self.base_url = base_url
+        self.session = requests.Session()
+
+    def request(self, method, path, headers=None, json=None, data=None):
+        response = self.session.request(method, self.base_url + path, headers=headers, json=json, data=data)
+        try:
+            return response.status_code, response.json(), response.headers
+        except ValueError:
+            return response.status_code, None, response.headers
+
+
+def seed(app, db, models, args, hasher):
+    # Bulk insert users -> cameras -> windows -> alerts (+ raw readings)
+    User, Camera, Window, Alert, Reading = models
+    password_hash = hasher.hash(PASSWORD)  # Hashing is slow, every user shares one
+    rng = random.Random(args.seed)
+
+    with app.app_context():
+        db.session.bulk_insert_mappings(User, [
+            {'id': user_id, 'username': f'bench{user_id}', 'email': f'bench{user_id}@example.com',
+             'password': password_hash}
+            for user_id in range(1, args.users + 1)])
+
+        cameras = []
+        for user_id in range(1, args.users + 1):
+            for _ in range(args.cameras):
+                cameras.append({'id': len(cameras) + 1, 'token': f'bench-camera-{len(cameras) + 1}',
+                                'user_id': user_id, 'name': f'Camera {len(cameras) + 1}'})
+        # Unpaired cameras for the pairing route
+        unpaired = [{'id': len(cameras) + index + 1, 'token': f'bench-unpaired-{index}'}
+                    for index in range(args.unpaired)]
+        db.session.bulk_insert_mappings(Camera, cameras + unpaired)
+
+        windows = []
+        for camera in cameras:
+            for index in range(args.windows):
+                windows.append({'id': len(windows) + 1, 'camera_id': camera['id'], 'name': f'Window {index}',
+                                'top_left_x': 10 * index, 'top_left_y': 10, 'bottom_right_x': 10 * index + 60,
+                                'bottom_right_y': 50})
+        db.session.bulk_insert_mappings(Window, windows)
+
+        alerts = [{'window_id': window['id'], 'threshold_value': float(rng.randint(40, 160)),
+                   'condition': rng.choice(['<', '>', '<=', '>='])}
+                  for window in windows for _ in range(args.alerts)]
+        db.session.bulk_insert_mappings(Alert, alerts)
+
+        now = datetime.utcnow()
+        readings = [{'window_id': window['id'], 'value': float(rng.randint(40, 160)),
+                     'timestamp': now - timedelta(seconds=second)}
+                    for window in windows for second in range(args.readings)]
+        db.session.bulk_insert_mappings(Reading, readings)
+        db.session.commit()
+
+    cameras_by_user = {}
+    for camera in cameras:
+        cameras_by_user.setdefault(camera['user_id'], []).append(camera)
+    windows_by_camera = {}
+    for window in windows:
+        windows_by_camera.setdefault(window['camera_id'], []).append(window['id'])
+    return cameras_by_user, windows_by_camera, [camera['token'] for camera in unpaired]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Load test every route in app.py')
+    parser.add_argument('--users', type=int, default=10)
+    parser.add_argument('--cameras', type=int, default=4, help='cameras per user')
+    parser.add_argument('--windows', type=int, default=6, help='windows per camera')
+    parser.add_argument('--alerts', type=int, default=3, help='alerts per window')
+    parser.add_argument('--readings', type=int, default=120, help='raw readings per window')
+    parser.add_argument('--unpaired', type=int, default=200, help='unpaired cameras for /pair_camera')
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--duration', type=float, default=20.0, help='seconds')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--frame', help='image to POST to /cameras/<id>/frames (starts the OCR pool)')
+    parser.add_argument('--url', help='drive a running server instead of the Flask test client, '
+                                      'the server must use the same (empty) DATABASE_URL')
+    parser.add_argument('--output', help='write the JSON report here instead of stdout')
+    args = parser.parse_args()
+
+    # Throwaway database unless one is given, set before the app is imported
+    if 'DATABASE_URL' not in os.environ:
+        database_path = os.path.join(tempfile.mkdtemp(), 'bench.sqlite3')
+        os.environ['DATABASE_URL'] = f'sqlite:///{database_path}'
+
+    from app import app, db, upgrade_database, password_hasher, User, Camera, Window, Alert, Reading
+    from benchmarks.latency import LatencyRecorder
+
+    with app.app_context():
+        upgrade_database()
+    cameras_by_user, windows_by_camera, unpaired_tokens = seed(
+        app, db, (User, Camera, Window, Alert, Reading), args, password_hasher)
+    frame = open(args.frame, 'rb').read() if args.frame else None
+
+    def new_client():
+        return HttpClient(args.url) if args.url else TestClient(app)
+
+    recorder = LatencyRecorder()
+    unpaired_lock = threading.Lock()
+    registrations = itertools.count(1)
+
+    def call(client, endpoint, method, path, **kwargs):
+        started = time.perf_counter()
+        status, body, headers = client.request(method, path, **kwargs)
+        recorder.record(endpoint, status, time.perf_counter() - started)
+        return status, body, headers
+
+    # Each scenario is (weight, function(client, context))
+    def get_cameras(client, ctx):
+        call(client, 'GET /cameras', 'GET', '/cameras', headers=ctx['headers'])
+
+    def get_windows(client, ctx):
+        call(client, 'GET /cameras/<id>/windows', 'GET', f'/cameras/{ctx["rng"].choice(ctx["cameras"])["id"]}/windows',
+             headers=ctx['headers'])
+
+    def get_windows_cached(client, ctx):
+        # Repeat of a list request with its ETag, a 304 unless windows were added meanwhile
+        headers = dict(ctx['headers'])
+        if ctx['etag']:
+            headers['If-None-Match'] = ctx['etag']
+        status, _, response_headers = call(client, 'GET /cameras/<id>/windows (If-None-Match)', 'GET',
+                                           f'/cameras/{ctx["cameras"][0]["id"]}/windows', headers=headers)
+        if status == 200:
+            ctx['etag'] = response_headers.get('ETag')
+
+    def get_alerts(client, ctx):
+        call(client, 'GET /windows/<id>/alerts', 'GET', f'/windows/{ctx["rng"].choice(ctx["windows"])}/alerts',
+             headers=ctx['headers'])
+
+    def create_alert(client, ctx):
+        call(client, 'POST /windows/<id>/alerts', 'POST', f'/windows/{ctx["rng"].choice(ctx["windows"])}/alerts',
+             headers=ctx['headers'], json={'threshold_value': ctx['rng'].randint(40, 160), 'condition': '>'})
+
+    def create_alerts_bulk(client, ctx):
+        alerts = [{'window_id': window_id, 'threshold_value': 100, 'condition': '<'}
+                  for window_id in ctx['rng'].sample(ctx['windows'], min(5, len(ctx['windows'])))]
+        call(client, 'POST /alerts/bulk', 'POST', '/alerts/bulk', headers=ctx['headers'], json={'alerts': alerts})
+
+    def add_window(client, ctx):
+        call(client, 'POST /add_window', 'POST', '/add_window', headers=ctx['headers'],
+             json={'name': 'Load', 'top_left_x': 0, 'top_left_y': 0, 'bottom_right_x': 40, 'bottom_right_y': 20,
+                   'camera_id': ctx['rng'].choice(ctx['cameras'])['id']})
+
+    def add_windows_bulk(client, ctx):
+        camera_id = ctx['rng'].choice(ctx['cameras'])['id']
+        windows = [{'name': f'Bulk {index}', 'top_left_x': 0, 'top_left_y': 0, 'bottom_right_x': 40,
+                    'bottom_right_y': 20, 'camera_id': camera_id} for index in range(5)]
+        call(client, 'POST /windows/bulk', 'POST', '/windows/bulk', headers=ctx['headers'], json={'windows': windows})
+
+    def get_tree(client, ctx):
+        call(client, 'GET /tree', 'GET', '/tree', headers=ctx['headers'])
+
+    def get_readings(client, ctx):
+        call(client, 'GET /windows/<id>/readings', 'GET', f'/windows/{ctx["rng"].choice(ctx["windows"])}/readings',
+             headers=ctx['headers'])
+
+    def pair_camera(client, ctx):
+        with unpaired_lock:
+            token = unpaired_tokens.pop() if unpaired_tokens else None
+        if token:
+            call(client, 'POST /pair_camera', 'POST', '/pair_camera', headers=ctx['headers'],
+                 json={'camera_token': token, 'name': 'Paired'})
+
+    def register(client, ctx):
+        # A new user every time, each one hashes its password at full cost
+        number = next(registrations)
+        call(client, 'POST /register', 'POST', '/register',
+             json={'username': f'load{number}', 'email': f'load{number}@example.com', 'password': PASSWORD})
+
+    def login(client, ctx):
+        call(client, 'POST /login', 'POST', '/login', json={'username': ctx['username'], 'password': PASSWORD})
+
+    def ocr_stats(client, ctx):
+        call(client, 'GET /ocr/stats', 'GET', '/ocr/stats', headers=ctx['headers'])
+
+    def get_schedule(client, ctx):
+        call(client, 'GET /schedule', 'GET', '/schedule', headers=ctx['headers'])
+
+    def firing_alerts(client, ctx):
+        call(client, 'GET /alerts/firing', 'GET', '/alerts/firing', headers=ctx['headers'])
+
+    def set_stream(client, ctx):
+        # Alternates between setting and clearing the stream of the worker's first camera
+        ctx['streaming'] = not ctx['streaming']
+        call(client, 'PUT /cameras/<id>/stream', 'PUT', f'/cameras/{ctx["cameras"][0]["id"]}/stream',
+             headers=ctx['headers'], json={'stream_url': BENCH_STREAM_URL if ctx['streaming'] else None})
+
+    def ping(client, ctx):
+        call(client, 'GET /test', 'GET', '/test')
+
+    def upload_frame(client, ctx):
+        camera = ctx['rng'].choice(ctx['cameras'])
+        call(client, 'POST /cameras/<id>/frames', 'POST', f'/cameras/{camera["id"]}/frames',
+             headers={'X-Camera-Token': camera['token'], 'Content-Type': 'application/octet-stream'}, data=frame)
+
+    def create_proposals(client, ctx):
+        camera = ctx['rng'].choice(ctx['cameras'])
+        headers = dict(ctx['headers'], **{'Content-Type': 'application/octet-stream'})
+        status, body, _ = call(client, 'POST /cameras/<id>/proposals', 'POST', f'/cameras/{camera["id"]}/proposals',
+                               headers=headers, data=frame)
+        if status == 201 and body and body.get('proposals'):
+            ctx['proposed'].add(camera['id'])
+
+    def get_proposals(client, ctx):
+        camera = ctx['rng'].choice(ctx['cameras'])
+        call(client, 'GET /cameras/<id>/proposals', 'GET', f'/cameras/{camera["id"]}/proposals',
+             headers=ctx['headers'])
+
+    def accept_proposals(client, ctx):
+        if ctx['proposed']:
+            camera_id = ctx['rng'].choice(sorted(ctx['proposed']))
+            call(client, 'POST /cameras/<id>/proposals/accept', 'POST', f'/cameras/{camera_id}/proposals/accept',
+                 headers=ctx['headers'], json={'proposals': [{'index': 0, 'name': 'Proposed'}]})
+
+    scenarios = [
+        (20, get_cameras), (20, get_windows), (10, get_windows_cached), (20, get_alerts), (10, get_tree),
+        (10, get_readings), (5, create_alert), (2, create_alerts_bulk), (3, add_window), (2, add_windows_bulk),
+        (1, pair_camera), (1, register), (2, login), (2, ocr_stats), (2, get_schedule), (2, firing_alerts),
+        (1, set_stream), (5, ping),
+    ]
+    if frame:
+        scenarios += [(20, upload_frame), (1, create_proposals), (2, get_proposals), (1, accept_proposals)]
+    weights = [weight for weight, _ in scenarios]
+
+    def worker(worker_id, ready):
+        rng = random.Random(args.seed * 1000 + worker_id)
+        client = new_client()
+        user_id = worker_id % args.users + 1
+        username = f'bench{user_id}'
+        _, body, _ = client.request('POST', '/login', json={'username': username, 'password': PASSWORD})
+        headers = {'Authorization': f'Bearer {body["access_token"]}'}
+        cameras = cameras_by_user[user_id]
+
+        ctx = {'rng': rng, 'headers': headers, 'username': username, 'cameras': cameras, 'etag': None,
+               'streaming': False, 'proposed': set(),
+               'windows': [window_id for camera in cameras for window_id in windows_by_camera.get(camera['id'], [])]}
+        ready.wait()
+
+        while time.monotonic() < clock['deadline']:
+            scenario = rng.choices(scenarios, weights=weights)[0][1]
+            scenario(client, ctx)
+
+    # Workers log in first, the clock starts once all of them are ready
+    clock = {}
+
+    def start_clock():
+        clock['started'] = time.monotonic()
+        clock['deadline'] = clock['started'] + args.duration
+
+    ready = threading.Barrier(args.threads + 1, action=start_clock)
+    threads = [threading.Thread(target=worker, args=(worker_id, ready)) for worker_id in range(args.threads)]
+    for thread in threads:
+        thread.start()
+    ready.wait()
+    for thread in threads:
+        thread.join()
+    elapsed = time.monotonic() - clock['started']
+
+    report = json.dumps({
+        'config': vars(args),
+        'elapsed': elapsed,
+        'endpoints': recorder.summary(elapsed),
+    }, indent=2)
+    if args.output:
+        with open(args.output, 'w') as output:
+            output.write(report)
+    else:
+        print(report)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,41 @@
+import collections
+import threading
+
+
+def percentile(sorted_values, fraction):
+    # Nearest-rank percentile of an already sorted list
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, max(0, int(round(fraction * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+
+class LatencyRecorder:
+    # Collects (endpoint, status, seconds) samples from many threads
+
+    def __init__(self):
+        self._samples = collections.defaultdict(list)
+        self._statuses = collections.defaultdict(collections.Counter)
+        self._lock = threading.Lock()
+
+    def record(self, endpoint, status, seconds):
+        with self._lock:
+            self._samples[endpoint].append(seconds)
+            self._statuses[endpoint][status] += 1
+
+    def summary(self, duration):
+        # Per endpoint throughput and latency percentiles in milliseconds
+        with self._lock:
+            results = {}
+            for endpoint, samples in sorted(self._samples.items()):
+                samples = sorted(samples)
+                results[endpoint] = {
+                    'requests': len(samples),
+                    'throughput': len(samples) / duration if duration else None,
+                    'statuses': {str(status): count for status, count in self._statuses[endpoint].items()},
+                    'p50_ms': percentile(samples, 0.50) * 1000,
+                    'p95_ms': percentile(samples, 0.95) * 1000,
+                    'p99_ms': percentile(samples, 0.99) * 1000,
+                    'max_ms': samples[-1] * 1000,
+                }
+            return results
@@ -0,0 +1,73 @@
+# Login throughput under contention, with a concurrent stream of cheap
+# authenticated requests to show whether logins stall other traffic.
+#
+#   python -m benchmarks.login_throughput --threads 16 --duration 10
+import argparse
+import json
+import os
+import tempfile
+import threading
+import time
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark /login under concurrent load')
+    parser.add_argument('--users', type=int, default=20)
+    parser.add_argument('--threads', type=int, default=16, help='concurrent login clients')
+    parser.add_argument('--background-threads', type=int, default=4, help='concurrent /cameras clients')
+    parser.add_argument('--duration', type=float, default=10.0, help='seconds')
+    args = parser.parse_args()
+
+    # Throwaway database, set before the app is imported
+    database_path = os.path.join(tempfile.mkdtemp(), 'bench.sqlite3')
+    os.environ['DATABASE_URL'] = f'sqlite:///{database_path}'
+
+    from app import app, upgrade_database
+    from benchmarks.latency import LatencyRecorder
+
+    with app.app_context():
+        upgrade_database()
+
+    client = app.test_client()
+    for index in range(args.users):
+        client.post('/register', json={'username': f'user{index}', 'email': f'user{index}@example.com',
+                                       'password': 'password'})
+    token = client.post('/login', json={'username': 'user0', 'password': 'password'}).get_json()['access_token']
+
+    recorder = LatencyRecorder()
+    deadline = time.monotonic() + args.duration
+
+    def login_worker(worker):
+        client = app.test_client()
+        index = worker
+        while time.monotonic() < deadline:
+            started = time.perf_counter()
+            response = client.post('/login', json={'username': f'user{index % args.users}', 'password': 'password'})
+            recorder.record('POST /login', response.status_code, time.perf_counter() - started)
+            index += 1
+
+    def background_worker():
+        client = app.test_client()
+        headers = {'Authorization': f'Bearer {token}'}
+        while time.monotonic() < deadline:
+            started = time.perf_counter()
+            response = client.get('/cameras', headers=headers)
+            recorder.record('GET /cameras', response.status_code, time.perf_counter() - started)
+
+    threads = [threading.Thread(target=login_worker, args=(worker,)) for worker in range(args.threads)]
+    threads += [threading.Thread(target=background_worker) for _ in range(args.background_threads)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    print(json.dumps({
+        'config': vars(args) | {'hash_method': app.config['PASSWORD_HASH_METHOD'],
+                                'hash_workers': app.config['PASSWORD_HASH_WORKERS'],
+                                'hash_queue': app.config['PASSWORD_HASH_QUEUE']},
+        'endpoints': recorder.summary(args.duration),
+    }, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,210 @@
+# Compares the OCR engines over the patient monitor images in model/data.
+# Each engine runs in its own process so cold start and peak RSS are its own.
+#
+#   python -m benchmarks.ocr_engines --engines easyocr tesseract
+#   python -m benchmarks.ocr_engines --init-labels   (writes a labels template to fill in)
+#
+# Labels file format, values are the numbers visible anywhere on the monitor and
+# windows are optional boxes with the number inside them. Images without
+# windows time the per-ROI and montage reads on the engine's own detections:
+#   {"test_image.jpg": {"values": ["98", "120"],
+#                       "windows": [{"box": [x1, y1, x2, y2], "value": "98"}]}}
+import argparse
+import json
+import multiprocessing
+import os
+import queue
+import time
+
+DATA_DIR = os.path.join('model', 'data')
+LABELS_PATH = os.path.join(DATA_DIR, 'labels.json')
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.webp', '.avif')
+
+
+def list_corpus(data_dir):
+    return sorted(os.path.join(data_dir, name) for name in os.listdir(data_dir)
+                  if name.lower().endswith(IMAGE_EXTENSIONS))
+
+
+def load_image(path):
+    from model import decode
+
+    with open(path, 'rb') as image_file:
+        frame = decode.decode(image_file.read())
+    return frame.image if frame is not None else None
+
+
+def run_engine(name, corpus, labels, results):
+    # Runs in a fresh process, reports one dict back through the results queue
+    import resource
+
+    from benchmarks.latency import percentile
+    from model import ocr
+
+    try:
+        started = time.perf_counter()
+        engine = ocr.create_engine(name)
+        cold_start = time.perf_counter() - started
+    except Exception as e:
+        results.put({'engine': name, 'error': f'{type(e).__name__}: {e}'})
+        return
+
+    montage_engine = ocr.MontageEngine(engine)
+    image_times = []
+    roi_times = []
+    montage_times = []
+    montage_correct = 0
+    values_found = values_expected = 0
+    windows_correct = windows_total = 0
+    unreadable = []
+
+    for path in corpus:
+        image = load_image(path)
+        if image is None:
+            unreadable.append(os.path.basename(path))
+            continue
+        label = labels.get(os.path.basename(path), {})
+
+        started = time.perf_counter()
+        detections = engine.detect(image)
+        image_times.append(time.perf_counter() - started)
+
+        detected = {ocr.parse_value(text) for _, text, _ in detections} - {None}
+        for value in label.get('values', []):
+            values_expected += 1
+            values_found += float(value) in detected
+
+        windows = label.get('windows', [])
+        if windows:
+            boxes = [window['box'] for window in windows]
+            expected = [float(window['value']) for window in windows]
+        else:
+            # Unlabelled, the detected boxes still give per-ROI latency but no accuracy
+            boxes = [box for box, _, _ in detections]
+            expected = [None] * len(boxes)
+
+        items = ocr.crop_windows(image, [(index, *box) for index, box in enumerate(boxes)])
+        for index, crop in items:
+            started = time.perf_counter()
+            text, _ = engine.read(crop)
+            roi_times.append(time.perf_counter() - started)
+
+            if expected[index] is not None:
+                windows_total += 1
+                windows_correct += ocr.parse_value(text) == expected[index]
+
+        # All of the image's windows in one montage pass
+        if items:
+            started = time.perf_counter()
+            texts = montage_engine.read_batch([crop for _, crop in items])
+            montage_times.append(time.perf_counter() - started)
+            montage_correct += sum(ocr.parse_value(text) == expected[index]
+                                   for (index, _), (text, _) in zip(items, texts) if expected[index] is not None)
+
+    image_times.sort()
+    roi_times.sort()
+    montage_times.sort()
+    results.put({
+        'engine': name,
+        'cold_start_s': cold_start,
+        'images': len(image_times),
+        'image_p50_ms': percentile(image_times, 0.5) * 1000 if image_times else None,
+        'image_p95_ms': percentile(image_times, 0.95) * 1000 if image_times else None,
+        'rois': len(roi_times),
+        'roi_p50_ms': percentile(roi_times, 0.5) * 1000 if roi_times else None,
+        'roi_p95_ms': percentile(roi_times, 0.95) * 1000 if roi_times else None,
+        # Per image, all windows together
+        'montage_p50_ms': percentile(montage_times, 0.5) * 1000 if montage_times else None,
+        # ru_maxrss is in kilobytes on Linux
+        'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        'value_recall': values_found / values_expected if values_expected else None,
+        'roi_accuracy': windows_correct / windows_total if windows_total else None,
+        'montage_accuracy': montage_correct / windows_total if windows_total else None,
+        'unreadable': unreadable,
+    })
+
+
+def wait_for_result(process, results, name):
+    # A crashed engine (e.g. killed for memory) must not hang the whole run
+    while True:
+        try:
+            return results.get(timeout=1)
+        except queue.Empty:
+            if not process.is_alive():
+                return {'engine': name, 'error': f'process exited with code {process.exitcode}'}
+
+
+def format_table(rows):
+    columns = ['engine', 'cold_start_s', 'image_p50_ms', 'image_p95_ms', 'roi_p50_ms', 'roi_p95_ms',
+               'montage_p50_ms', 'peak_rss_mb', 'value_recall', 'roi_accuracy', 'montage_accuracy']
+
+    def cell(value):
+        if value is None:
+            return '-'
+        if isinstance(value, float):
+            return f'{value:.3f}'
+        return str(value)
+
+    table = [columns] + [[cell(row.get(column)) if 'error' not in row or column == 'engine' else 'error'
+                          for column in columns] for row in rows]
+    widths = [max(len(line[index]) for line in table) for index in range(len(columns))]
+    return '\n'.join('  '.join(value.ljust(width) for value, width in zip(line, widths)) for line in table)
+
+
+def init_labels(corpus, labels_path):
+    # Template with every image, existing labels are kept
+    labels = {}
+    if os.path.exists(labels_path):
+        with open(labels_path) as labels_file:
+            labels = json.load(labels_file)
+    for path in corpus:
+        labels.setdefault(os.path.basename(path), {'values': [], 'windows': []})
+    with open(labels_path, 'w') as labels_file:
+        json.dump(labels, labels_file, indent=2, ensure_ascii=False)
+    print(f'Wrote {len(labels)} entries to {labels_path}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark OCR engines on model/data')
+    parser.add_argument('--engines', nargs='+', default=['easyocr', 'tesseract', 'digits', 'onnx'])
+    parser.add_argument('--data', default=DATA_DIR)
+    parser.add_argument('--labels', default=LABELS_PATH)
+    parser.add_argument('--json', help='also write the raw results here')
+    parser.add_argument('--init-labels', action='store_true', help='write a labels template and exit')
+    args = parser.parse_args()
+
+    corpus = list_corpus(args.data)
+    if args.init_labels:
+        init_labels(corpus, args.labels)
+        return
+
+    labels = {}
+    if os.path.exists(args.labels):
+        with open(args.labels) as labels_file:
+            labels = json.load(labels_file)
+    else:
+        print(f'No labels at {args.labels}, accuracy columns will be empty (see --init-labels)')
+
+    context = multiprocessing.get_context('spawn')
+    rows = []
+    for name in args.engines:
+        results = context.Queue()
+        process = context.Process(target=run_engine, args=(name, corpus, labels, results))
+        process.start()
+        rows.append(wait_for_result(process, results, name))
+        process.join()
+
+    print(format_table(rows))
+    for row in rows:
+        if row.get('error'):
+            print(f'{row["engine"]}: {row["error"]}')
+        elif row.get('unreadable'):
+            print(f'{row["engine"]}: could not decode {", ".join(row["unreadable"])}')
+
+    if args.json:
+        with open(args.json, 'w') as json_file:
+            json.dump(rows, json_file, indent=2)
+
+
+if __name__ == '__main__':
+    main()
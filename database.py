@@ -0,0 +1,94 @@
+import sqlite3
+from datetime import datetime
+
+from sqlalchemy import Column, DateTime, Integer, MetaData, String, Table, event, inspect, select
+from sqlalchemy.engine import Engine
+
+
+def engine_options(uri, pool_size=10, max_overflow=20, pool_recycle=1800, busy_timeout=5.0):
+    # SQLALCHEMY_ENGINE_OPTIONS for the configured database
+    if uri.startswith('sqlite'):
+        # Connections move between request threads, sqlite3 waits busy_timeout on a locked database
+        return {'connect_args': {'timeout': busy_timeout, 'check_same_thread': False}}
+
+    # Server databases get a real pool and drop connections the server has closed
+    return {
+        'pool_size': pool_size,
+        'max_overflow': max_overflow,
+        'pool_recycle': pool_recycle,
+        'pool_pre_ping': True,
+    }
+
+
+def configure_sqlite(synchronous='NORMAL', busy_timeout_ms=5000):
+    # WAL lets readers run next to a writer, NORMAL sync is safe with WAL and skips an fsync per commit
+    @event.listens_for(Engine, 'connect')
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        if not isinstance(dbapi_connection, sqlite3.Connection):
+            return
+        cursor = dbapi_connection.cursor()
+        cursor.execute('PRAGMA journal_mode=WAL')
+        cursor.execute(f'PRAGMA synchronous={synchronous}')
+        cursor.execute(f'PRAGMA busy_timeout={int(busy_timeout_ms)}')
+        cursor.close()
+
+
+# Migrations
+
+_migration_metadata = MetaData()
+
+schema_version = Table('schema_version', _migration_metadata,
+                       Column('version', Integer, primary_key=True),
+                       Column('description', String(200), nullable=False),
+                       Column('applied_at', DateTime, nullable=False))
+
+
+def create_missing_indexes(connection, metadata):
+    # Indexes declared on the models that older databases were created without
+    for table in metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(connection, checkfirst=True)
+
+
+def add_missing_columns(connection, metadata):
+    # Nullable columns added to the models after their table was created
+    inspector = inspect(connection)
+    preparer = connection.dialect.identifier_preparer
+    for table in metadata.sorted_tables:
+        existing = {column['name'] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in existing:
+                continue
+            if not column.nullable:
+                raise RuntimeError(f'Cannot add NOT NULL column {table.name}.{column.name} without a default')
+            column_type = column.type.compile(dialect=connection.dialect)
+            connection.exec_driver_sql(f'ALTER TABLE {preparer.format_table(table)} '
+                                       f'ADD COLUMN {preparer.format_column(column)} {column_type}')
+
+
+# (version, description, function(connection, metadata)), append new ones at the end
+MIGRATIONS = [
+    (1, 'Index foreign keys used by the list queries', create_missing_indexes),
+    (2, 'Add camera.stream_url', add_missing_columns),
+]
+
+
+def upgrade(engine, metadata):
+    # Apply every migration newer than the recorded schema version, returns the versions applied
+    schema_version.create(engine, checkfirst=True)
+
+    with engine.connect() as connection:
+        current = connection.execute(select(schema_version.c.version)
+                                     .order_by(schema_version.c.version.desc())).scalar() or 0
+
+    applied = []
+    for version, description, migrate in MIGRATIONS:
+        if version <= current:
+            continue
+        with engine.begin() as connection:
+            migrate(connection, metadata)
+            connection.execute(schema_version.insert().values(version=version,
+                                                              description=description,
+                                                              applied_at=datetime.utcnow()))
+        applied.append(version)
+    return applied
@@ -0,0 +1,23 @@
+import threading
+import uuid
+
+
+class CollectionVersions:
+    # Version counter per collection, e.g. ('windows', camera_id), bumped on every
+    # write so list endpoints can answer If-None-Match without touching the database
+
+    def __init__(self):
+        # Counters restart with the process, the epoch keeps old ETags from matching
+        self.epoch = uuid.uuid4().hex[:8]
+        self._versions = {}
+        self._lock = threading.Lock()
+
+    def bump(self, name, owner_id):
+        with self._lock:
+            key = (name, owner_id)
+            self._versions[key] = self._versions.get(key, 0) + 1
+
+    def etag(self, name, owner_id, *parts):
+        with self._lock:
+            version = self._versions.get((name, owner_id), 0)
+        return '-'.join(str(part) for part in (self.epoch, name, owner_id, version) + parts)
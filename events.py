@@ -0,0 +1,155 @@
+import collections
+import json
+import queue
+import threading
+import uuid
+
+
+def format_event(event_id, event_type, data):
+    # Server-Sent Events wire format, event_id is the broker's formatted id
+    return f'id: {event_id}\nevent: {event_type}\ndata: {json.dumps(data)}\n\n'
+
+
+RESET_MESSAGE = {'message': 'Missed events, reload current state'}
+
+
+class Subscription:
+    def __init__(self, broker, user_id, last_event_id, queue_size):
+        self.broker = broker
+        self.user_id = user_id
+        self.last_event_id = last_event_id
+        self.queue = queue.Queue(maxsize=queue_size)
+
+        # Set when the client fell behind and must catch up from the history
+        self.lagging = last_event_id is not None
+        # Set when the client's last event id is from another server run
+        self.needs_reset = False
+        self._lock = threading.Lock()
+
+    def push(self, event):
+        with self._lock:
+            if self.lagging:
+                return
+            try:
+                self.queue.put_nowait(event)
+            except queue.Full:
+                # Slow client, stop queueing and let it replay once it catches up
+                self.lagging = True
+
+    def next_events(self, timeout):
+        # Blocks up to timeout, returns the events to send next (possibly none)
+        with self._lock:
+            if self.needs_reset:
+                self.needs_reset = False
+                events = [event for event in self._drain() if event[0] > self.last_event_id]
+                reset = [(self.last_event_id, 'reset', RESET_MESSAGE)]
+                self._advance(events)
+                return reset + events
+            if self.lagging:
+                # Send what was queued before the overflow, then replay the rest from history
+                self.lagging = False
+                events = [event for event in self._drain() if event[0] > self.last_event_id]
+                self._advance(events)
+                events += self.broker.replay(self.user_id, self.last_event_id)
+                self._advance(events)
+                return events
+
+        try:
+            events = [self.queue.get(timeout=timeout)]
+        except queue.Empty:
+            return []
+
+        with self._lock:
+            events.extend(self._drain())
+            # Anything already sent through a replay is skipped
+            events = [event for event in events if event[0] > self.last_event_id]
+            self._advance(events)
+            return events
+
+    def _drain(self):
+        events = []
+        while True:
+            try:
+                events.append(self.queue.get_nowait())
+            except queue.Empty:
+                return events
+
+    def _advance(self, events):
+        if events:
+            self.last_event_id = events[-1][0]
+
+
+class EventBroker:
+    # Fans out reading and alert events to the streams of the user that owns the
+    # camera, keeping a short history per user so clients can resume
+
+    def __init__(self, history_size=500, queue_size=100):
+        self.history_size = history_size
+        self.queue_size = queue_size
+
+        # Ids restart with the process, the epoch tells ids from an earlier run apart
+        self.epoch = uuid.uuid4().hex[:8]
+        self._next_id = 1
+        self._history = {}  # user_id -> deque of (event_id, event_type, data)
+        self._evicted = {}  # user_id -> newest event id that fell out of the history
+        self._subscribers = {}  # user_id -> set of Subscription
+        self._lock = threading.Lock()
+
+    def publish(self, user_id, event_type, data):
+        with self._lock:
+            event = (self._next_id, event_type, data)
+            self._next_id += 1
+
+            history = self._history.setdefault(user_id, collections.deque(maxlen=self.history_size))
+            if len(history) == history.maxlen:
+                self._evicted[user_id] = history[0][0]
+            history.append(event)
+            subscribers = list(self._subscribers.get(user_id, ()))
+
+        for subscription in subscribers:
+            subscription.push(event)
+
+    def format_id(self, event_id):
+        return f'{self.epoch}-{event_id}'
+
+    def parse_id(self, value):
+        # Event id a client sent back, None when it isn't one this process handed out
+        epoch, _, event_id = (value or '').partition('-')
+        if epoch != self.epoch or not event_id.isdigit():
+            return None
+        return int(event_id)
+
+    def subscribe(self, user_id, last_event_id=None, reset=False):
+        # reset starts the client from now with a reset event, for last event
+        # ids that can't be resumed from
+        with self._lock:
+            if last_event_id is not None and last_event_id >= self._next_id:
+                last_event_id, reset = None, True
+            subscription = Subscription(self, user_id, last_event_id, self.queue_size)
+            if last_event_id is None:
+                # New clients start from now, the cursor is only used if they fall behind
+                subscription.last_event_id = self._next_id - 1
+                subscription.needs_reset = reset
+            self._subscribers.setdefault(user_id, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscribers = self._subscribers.get(subscription.user_id)
+            if subscribers:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._subscribers[subscription.user_id]
+
+    def replay(self, user_id, last_event_id):
+        # Events after last_event_id, or a reset event when some were already lost
+        with self._lock:
+            history = list(self._history.get(user_id, ()))
+            evicted = self._evicted.get(user_id, 0)
+
+        events = [event for event in history if event[0] > last_event_id]
+        if last_event_id < evicted:
+            # Ids are only used for ordering here, the client refetches everything on reset
+            reset_id = events[0][0] - 1 if events else evicted
+            events.insert(0, (reset_id, 'reset', RESET_MESSAGE))
+        return events
@@ -1,3 +1,6 @@
+import json
+import time
+
 import requests
 
 class Menu:
@@ -17,6 +20,21 @@ class Menu:
         self.nav_stack.append(page)
         self.render_active_page(optional)
     
+    def fetch_all(self, path, key):
+        # List endpoints are paged, follow the cursor until the last page
+        headers = {'Authorization': f'Bearer {self.access_token}'}
+        items = []
+        params = {}
+        while True:
+            response = requests.get(url=self.server_url + path, headers=headers, params=params)
+            response.raise_for_status()
+            json_response = response.json()
+
+            items.extend(json_response[key])
+            if not json_response.get('next_cursor'):
+                return items
+            params['after'] = json_response['next_cursor']
+
     def render_page_header(self, header_message=''):
         
         if header_message:
@@ -48,6 +66,7 @@ class Menu:
             'register': self.register_page,
             'main_menu': self.main_menu_page,
             'create_window': self.create_window_page,
+            'propose_windows': self.propose_windows_page,
             'select_camera_add': self.select_camera_add_page,
             'select_camera_view': self.select_camera_view_page,
             'view_windows': self.view_windows_page,
@@ -56,7 +75,9 @@ class Menu:
             'create_alert': self.create_alert_page,
             'select_camera_view_alerts': self.select_camera_view_alerts_page,  # New page for selecting camera for viewing alerts
             'select_window_view_alerts': self.select_window_view_alerts_page,  # New page for selecting window for viewing alerts
-            'view_alerts': self.view_alerts_page  # New page for viewing alerts
+            'view_alerts': self.view_alerts_page,  # New page for viewing alerts
+            'live_feed': self.live_feed_page,
+            'overview': self.overview_page
         }
 
         print('\n\n----------------------------------------\n')
@@ -176,6 +197,12 @@ class Menu:
                 elif selection == '4':
                     self.forward('select_camera_view_alerts')
                     return
+                elif selection == '5':
+                    self.forward('live_feed')
+                    return
+                elif selection == '6':
+                    self.forward('overview')
+                    return
                 elif selection == 'b':
                     self.nav_stack = ['initial_page']
                     self.render_active_page()
@@ -189,14 +216,19 @@ class Menu:
         print('|----- 2. View Windows')
         print('|----- 3. Add Alert')  
         print('|----- 4. View Alerts')  # New option for viewing alerts
+        print('|----- 5. Live Feed')
+        print('|----- 6. Overview')
         process_selection()
     
     def create_window_page(self, camera):
         def process_input():
-            name = input("|- Enter the window name: ")
+            name = input("|- Enter the window name (P to propose from a frame): ")
             if name.lower() == 'b':
                 self.back()
                 return
+            if name.lower() == 'p':
+                self.forward('propose_windows', camera)
+                return
             top_left_x = input("|- Enter top left x coord: ")
             if top_left_x.lower() == 'b':
                 self.back()
@@ -241,13 +273,68 @@ class Menu:
         self.render_page_header(header_message=f'Create Window: {camera["name"]}')
         process_input()
 
-    def select_camera_add_page(self):
+    def propose_windows_page(self, camera):
         def process_input():
             headers = {'Authorization': f'Bearer {self.access_token}'}
-            response = requests.get(url=self.server_url + '/cameras', headers=headers)
+            proposals_url = self.server_url + f'/cameras/{camera["id"]}/proposals'
+
+            path = input("|- Enter the path of a frame from this camera: ")
+            if path.lower() == 'b':
+                self.back(camera)
+                return
+
+            try:
+                with open(path, 'rb') as frame:
+                    response = requests.post(url=proposals_url, files={'frame': frame}, headers=headers)
+            except OSError as e:
+                print(f'Could not open frame: {e}')
+                process_input()
+                return
+
             json_response = response.json()
-        
-            cameras = json_response['cameras']
+            if response.status_code != 201:
+                print(json_response['message'])
+                process_input()
+                return
+
+            proposals = json_response['proposals']
+            if not proposals:
+                print('No numbers found in this frame')
+                process_input()
+                return
+
+            for proposal in proposals:
+                print(f'|----- {proposal["index"] + 1}. "{proposal["text"]}" at '
+                      f'({proposal["top_left_x"]}, {proposal["top_left_y"]}) - '
+                      f'({proposal["bottom_right_x"]}, {proposal["bottom_right_y"]})')
+
+            selection = input("|- Enter the numbers to keep, separated by commas: ")
+            if selection.lower() == 'b':
+                self.back(camera)
+                return
+
+            chosen = []
+            for number in selection.split(','):
+                if not number.strip().isdigit():
+                    continue
+                index = int(number) - 1
+                name = input(f'|- Name for {number.strip()} (blank for "{proposals[index]["name"]}"): ') \
+                    if 0 <= index < len(proposals) else ''
+                chosen.append({'index': index, 'name': name.strip()})
+
+            response = requests.post(url=proposals_url + '/accept', json={'proposals': chosen}, headers=headers)
+            print(response.json()['message'])
+            if response.status_code in (201, 207):
+                self.back(camera)
+            else:
+                process_input()
+
+        self.render_page_header(header_message=f'Propose Windows: {camera["name"]}')
+        process_input()
+
+    def select_camera_add_page(self):
+        def process_input():
+            cameras = self.fetch_all('/cameras', 'cameras')
 
             for index, camera in enumerate(cameras):
                 print(f'|----- {index+1}. {camera["name"]}')
@@ -274,11 +361,7 @@ class Menu:
 
     def select_camera_view_page(self):
         def process_input():
-            headers = {'Authorization': f'Bearer {self.access_token}'}
-            response = requests.get(url=self.server_url + '/cameras', headers=headers)
-            json_response = response.json()
-        
-            cameras = json_response['cameras']
+            cameras = self.fetch_all('/cameras', 'cameras')
 
             for index, camera in enumerate(cameras):
                 print(f'|----- {index+1}. {camera["name"]}')
@@ -305,11 +388,7 @@ class Menu:
     
     def view_windows_page(self, camera):
         def process_input():
-            headers = {'Authorization': f'Bearer {self.access_token}'}
-            response = requests.get(url=self.server_url + f'/cameras/{camera["id"]}/windows', headers=headers)
-            json_response = response.json()
-        
-            windows = json_response['windows']
+            windows = self.fetch_all(f'/cameras/{camera["id"]}/windows', 'windows')
 
             for index, window in enumerate(windows):
                 print(f'|----- {window["name"]}: ({window["top_left_x"]}, {window["top_left_y"]}) ({window["bottom_right_x"]}, {window["bottom_right_y"]})')
@@ -325,11 +404,7 @@ class Menu:
     
     def select_camera_alert_page(self):
         def process_input():
-            headers = {'Authorization': f'Bearer {self.access_token}'}
-            response = requests.get(url=self.server_url + '/cameras', headers=headers)
-            json_response = response.json()
-        
-            cameras = json_response['cameras']
+            cameras = self.fetch_all('/cameras', 'cameras')
 
             for index, camera in enumerate(cameras):
                 print(f'|----- {index+1}. {camera["name"]}')
@@ -352,11 +427,7 @@ class Menu:
 
     def select_window_alert_page(self, camera):
         def process_input():
-            headers = {'Authorization': f'Bearer {self.access_token}'}
-            response = requests.get(url=self.server_url + f'/cameras/{camera["id"]}/windows', headers=headers)
-            json_response = response.json()
-        
-            windows = json_response['windows']
+            windows = self.fetch_all(f'/cameras/{camera["id"]}/windows', 'windows')
 
             for index, window in enumerate(windows):
                 print(f'|----- {index+1}. {window["name"]}: ({window["top_left_x"]}, {window["top_left_y"]}) ({window["bottom_right_x"]}, {window["bottom_right_y"]})')
@@ -413,11 +484,7 @@ class Menu:
 
     def select_camera_view_alerts_page(self):
         def process_input():
-            headers = {'Authorization': f'Bearer {self.access_token}'}
-            response = requests.get(url=self.server_url + '/cameras', headers=headers)
-            json_response = response.json()
-        
-            cameras = json_response['cameras']
+            cameras = self.fetch_all('/cameras', 'cameras')
 
             for index, camera in enumerate(cameras):
                 print(f'|----- {index+1}. {camera["name"]}')
@@ -440,11 +507,7 @@ class Menu:
 
     def select_window_view_alerts_page(self, camera):
         def process_input():
-            headers = {'Authorization': f'Bearer {self.access_token}'}
-            response = requests.get(url=self.server_url + f'/cameras/{camera["id"]}/windows', headers=headers)
-            json_response = response.json()
-        
-            windows = json_response['windows']
+            windows = self.fetch_all(f'/cameras/{camera["id"]}/windows', 'windows')
 
             for index, window in enumerate(windows):
                 print(f'|----- {index+1}. {window["name"]}: ({window["top_left_x"]}, {window["top_left_y"]}) ({window["bottom_right_x"]}, {window["bottom_right_y"]})')
@@ -466,27 +529,87 @@ class Menu:
         process_input()
 
     def view_alerts_page(self, window):
+        def process_input():
+            try:
+                alerts = self.fetch_all(f'/windows/{window["id"]}/alerts', 'alerts')
+
+                if not alerts:
+                    print('|----- No alerts set for this window.')
+                else:
+                    print('|----- Alerts for window:', window["name"])
+                    for index, alert in enumerate(alerts):
+                        print(f'|----- Alert {index+1}: Condition: {alert["condition"]} {alert["threshold_value"]}')
+
+            except requests.exceptions.HTTPError as e:
+                print(f'|----- Error {e.response.status_code}: Could not retrieve alerts for this window.')
+            except ValueError:
+                print('|----- Failed to retrieve alerts: Invalid server response')
+
+            while True:
+                selection = input('|- (B/b) Back to previous menu: ')
+                if selection.lower() == 'b':
+                    self.back()
+                    return
+
+        self.render_page_header(header_message=f'View Alerts for Window: {window["name"]}')
+        process_input()
+
+
+    def live_feed_page(self):
         def process_input():
             headers = {'Authorization': f'Bearer {self.access_token}'}
-            response = requests.get(url=self.server_url + f'/windows/{window["id"]}/alerts', headers=headers)
-            
-            # Check if the response is successful and contains JSON data
+            last_event_id = None
+            print('|----- Listening for readings and alerts, press Ctrl+C to go back')
+
+            try:
+                while True:
+                    # Resume from the last event seen if the connection drops
+                    if last_event_id:
+                        headers['Last-Event-ID'] = last_event_id
+                    try:
+                        response = requests.get(url=self.server_url + '/stream', headers=headers, stream=True)
+                        if response.status_code != 200:
+                            print(f'|----- Error {response.status_code}: Could not open live feed.')
+                            break
+
+                        event_type = None
+                        for line in response.iter_lines(decode_unicode=True):
+                            if line.startswith('id: '):
+                                last_event_id = line[4:]
+                            elif line.startswith('event: '):
+                                event_type = line[7:]
+                            elif line.startswith('data: '):
+                                self.print_event(event_type, json.loads(line[6:]))
+                    except requests.exceptions.RequestException:
+                        # Also a stream cut off mid-response when the server restarts
+                        print('|----- Connection lost, reconnecting...')
+                        time.sleep(3)
+            except KeyboardInterrupt:
+                pass
+
+            self.back()
+
+        self.render_page_header(header_message='Live Feed')
+        process_input()
+
+    def overview_page(self):
+        def process_input():
+            # Cameras, windows and alerts all come back from a single request
+            headers = {'Authorization': f'Bearer {self.access_token}'}
+            response = requests.get(url=self.server_url + '/tree', headers=headers)
+
             if response.status_code == 200:
-                try:
-                    json_response = response.json()
-                    alerts = json_response.get('alerts', [])
-
-                    if not alerts:
-                        print('|----- No alerts set for this window.')
-                    else:
-                        print('|----- Alerts for window:', window["name"])
-                        for index, alert in enumerate(alerts):
-                            print(f'|----- Alert {index+1}: Condition: {alert["condition"]} {alert["threshold_value"]}')
-
-                except ValueError:
-                    print('|----- Failed to retrieve alerts: Invalid server response')
+                cameras = response.json()['cameras']
+                if not cameras:
+                    print('|----- No cameras paired.')
+                for camera in cameras:
+                    print(f'|----- {camera["name"]}')
+                    for window in camera['windows']:
+                        print(f'|-------- {window["name"]}: ({window["top_left_x"]}, {window["top_left_y"]}) ({window["bottom_right_x"]}, {window["bottom_right_y"]})')
+                        for alert in window['alerts']:
+                            print(f'|----------- Alert: Condition: {alert["condition"]} {alert["threshold_value"]}')
             else:
-                print(f'|----- Error {response.status_code}: Could not retrieve alerts for this window.')
+                print(f'|----- Error {response.status_code}: Could not retrieve overview.')
 
             while True:
                 selection = input('|- (B/b) Back to previous menu: ')
@@ -494,9 +617,23 @@ class Menu:
                     self.back()
                     return
 
-        self.render_page_header(header_message=f'View Alerts for Window: {window["name"]}')
+        self.render_page_header(header_message='Overview')
         process_input()
 
+    def print_event(self, event_type, data):
+        if event_type == 'alert':
+            print(f'|----- ALERT window {data["window_id"]}: {data["value"]} {data["condition"]} {data["threshold_value"]}')
+        elif event_type == 'readings':
+            for reading in data['readings']:
+                print(f'|----- {reading["name"]}: {reading["value"]}')
+        elif event_type == 'notification':
+            name = data.get('window_name') or f'window {data["window_id"]}'
+            for alert in data['firing']:
+                print(f'|----- FIRING {name}: {alert["value"]} {alert["condition"]} {alert["threshold_value"]}')
+            for alert in data['resolved']:
+                print(f'|----- RESOLVED {name}: {alert["value"]} {alert["condition"]} {alert["threshold_value"]}')
+        elif event_type == 'reset':
+            print(f'|----- {data["message"]}')
 
 
 
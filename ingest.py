@@ -0,0 +1,270 @@
+import os
+import threading
+import time
+from urllib.parse import urlsplit
+
+import cv2
+
+# Network cameras only. cv2.VideoCapture hands URLs to FFmpeg, which would also
+# read local files and devices or follow other protocols for whoever sets a URL
+STREAM_SCHEMES = ('rtsp', 'rtsps', 'http', 'https')
+# What FFmpeg itself may open underneath those, e.g. for segments an HLS playlist names
+FFMPEG_PROTOCOLS = 'rtsp,rtsps,rtp,srtp,udp,tcp,tls,http,https,httpproxy,crypto'
+
+
+def stream_url_error(url, allow_files=False):
+    # Why a stream URL can't be used, None when it can. Local video files are
+    # only for tests and demos and have to be allowed explicitly
+    if allow_files and os.path.isfile(url):
+        return None
+    if any(character.isspace() or ord(character) < 32 for character in url):
+        return 'Stream URL must not contain whitespace'
+    parts = urlsplit(url)
+    if parts.scheme.lower() not in STREAM_SCHEMES or not parts.hostname:
+        return 'Stream URL must be an rtsp(s) or http(s) URL with a host'
+    return None
+
+
+class LatestFrame:
+    # Single slot holding the newest frame of one camera. A new frame replaces
+    # one nobody took yet, so a slow consumer causes drops instead of a backlog
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._frame = None
+        self._captured_at = None
+        self.received = 0
+        self.dropped = 0
+        self.stale = 0
+
+    def put(self, frame):
+        with self._lock:
+            if self._frame is not None:
+                self.dropped += 1
+            self._frame = frame
+            self._captured_at = time.monotonic()
+            self.received += 1
+
+    def ready(self):
+        with self._lock:
+            return self._frame is not None
+
+    def take(self, max_age=None):
+        # Hands out the newest frame once, None when there is none or it is too old
+        with self._lock:
+            frame, captured_at = self._frame, self._captured_at
+            self._frame = None
+            if frame is not None and max_age is not None and time.monotonic() - captured_at > max_age:
+                self.stale += 1
+                return None
+        return frame
+
+
+class StreamReader(threading.Thread):
+    # Decodes one camera's RTSP/MJPEG/HTTP stream or video file into its
+    # LatestFrame, reconnecting when the stream breaks. Video files are played
+    # back at their own frame rate and looped so they behave like a live camera
+
+    def __init__(self, camera_id, url, slot, reconnect_delay=5.0, loop_files=True, allow_files=False):
+        super().__init__(name=f'ingest-{camera_id}', daemon=True)
+        self.camera_id = camera_id
+        self.url = url
+        self.slot = slot
+        self.reconnect_delay = reconnect_delay
+        self.allow_files = allow_files
+        self.loop_files = loop_files
+        self.is_file = allow_files and os.path.isfile(url)
+
+        self.connected = False
+        self.error = None
+        self._stopped = threading.Event()
+
+    def stop(self):
+        self._stopped.set()
+
+    def run(self):
+        # Checked again here, the URL may have been stored before it was validated
+        self.error = stream_url_error(self.url, self.allow_files)
+        if self.error:
+            return
+
+        while not self._stopped.is_set():
+            capture = cv2.VideoCapture(self.url, cv2.CAP_FFMPEG)
+            try:
+                if capture.isOpened():
+                    self._read(capture)
+                else:
+                    self.error = 'Could not open stream'
+            finally:
+                capture.release()
+                self.connected = False
+
+            if self.is_file and not self.loop_files:
+                return
+            if not self.is_file or self.error:
+                self._stopped.wait(self.reconnect_delay)
+
+    def _read(self, capture):
+        if self.is_file:
+            fps = capture.get(cv2.CAP_PROP_FPS)
+            frame_time = 1.0 / fps if fps and fps > 0 else 1.0 / 25
+        else:
+            # Live sources are read as fast as they arrive, keep the backend's
+            # own buffer small so reads return the newest frame
+            capture.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+            frame_time = 0
+
+        started = time.monotonic()
+        count = 0
+        while not self._stopped.is_set():
+            ok, frame = capture.read()
+            if not ok:
+                # End of file, or the stream dropped
+                if not self.is_file:
+                    self.error = 'Stream ended'
+                return
+
+            self.connected = True
+            self.error = None
+            self.slot.put(frame)
+
+            count += 1
+            if frame_time:
+                delay = started + count * frame_time - time.monotonic()
+                if delay > 0:
+                    self._stopped.wait(delay)
+
+
+class IngestDaemon:
+    # Keeps a StreamReader per camera that has a stream and feeds the newest
+    # frames to process(camera_id, image) from a few worker threads. Each
+    # camera is processed at most once per interval(camera_id) seconds and
+    # the most overdue camera goes first
+
+    def __init__(self, load_sources, process, interval, workers=2, max_age=2.0,
+                 refresh_interval=30.0, reconnect_delay=5.0, allow_files=False, on_stop=None):
+        self.load_sources = load_sources  # returns {camera_id: stream_url}
+        self.process = process
+        self.interval = interval
+        self.workers = workers
+        self.max_age = max_age
+        self.refresh_interval = refresh_interval
+        self.reconnect_delay = reconnect_delay
+        self.allow_files = allow_files
+        self.on_stop = on_stop  # called with the camera_id of every stream that is stopped
+
+        self._readers = {}  # camera_id -> StreamReader
+        self._next_due = {}  # camera_id -> monotonic time
+        self._busy = set()
+        self._processed = {}
+        self._errors = {}
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._threads = []
+
+    def start(self):
+        if self._threads:
+            return
+        # Read by OpenCV when a capture is opened, so it covers every reader
+        protocols = FFMPEG_PROTOCOLS + (',file' if self.allow_files else '')
+        os.environ.setdefault('OPENCV_FFMPEG_CAPTURE_OPTIONS', f'protocol_whitelist;{protocols}')
+        self.refresh()
+        self._threads = [threading.Thread(target=self._refresh_loop, name='ingest-refresh', daemon=True)]
+        self._threads += [threading.Thread(target=self._work, name=f'ingest-worker-{index}', daemon=True)
+                          for index in range(self.workers)]
+        for thread in self._threads:
+            thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        with self._lock:
+            for reader in self._readers.values():
+                reader.stop()
+
+    @property
+    def running(self):
+        return bool(self._threads) and not self._stopped.is_set()
+
+    def refresh(self):
+        # Start readers for new streams, stop the ones removed or changed
+        try:
+            sources = self.load_sources()
+        except Exception as e:
+            print('Failed to load camera streams', e)
+            return
+
+        stopped = []
+        with self._lock:
+            for camera_id, reader in list(self._readers.items()):
+                if sources.get(camera_id) != reader.url:
+                    reader.stop()
+                    del self._readers[camera_id]
+                    self._next_due.pop(camera_id, None)
+                    stopped.append(camera_id)
+
+            for camera_id, url in sources.items():
+                if camera_id not in self._readers:
+                    reader = StreamReader(camera_id, url, LatestFrame(), reconnect_delay=self.reconnect_delay,
+                                          allow_files=self.allow_files)
+                    reader.start()
+                    self._readers[camera_id] = reader
+                    self._next_due[camera_id] = time.monotonic()
+
+        if self.on_stop is not None:
+            for camera_id in stopped:
+                self.on_stop(camera_id)
+
+    def _refresh_loop(self):
+        while not self._stopped.wait(self.refresh_interval):
+            self.refresh()
+
+    def _claim(self):
+        # The most overdue idle camera that has a frame waiting, or None
+        now = time.monotonic()
+        with self._lock:
+            due = [(next_due, camera_id) for camera_id, next_due in self._next_due.items()
+                   if next_due <= now and camera_id not in self._busy
+                   and self._readers[camera_id].slot.ready()]
+            if not due:
+                return None, None
+            _, camera_id = min(due)
+            self._busy.add(camera_id)
+            return camera_id, self._readers[camera_id].slot
+
+    def _work(self):
+        while not self._stopped.is_set():
+            camera_id, slot = self._claim()
+            if camera_id is None:
+                self._stopped.wait(0.02)
+                continue
+
+            try:
+                frame = slot.take(self.max_age)
+                if frame is not None:
+                    self.process(camera_id, frame)
+                    self._processed[camera_id] = self._processed.get(camera_id, 0) + 1
+            except Exception as e:
+                self._errors[camera_id] = str(e)
+            finally:
+                with self._lock:
+                    self._busy.discard(camera_id)
+                    if camera_id in self._next_due:
+                        self._next_due[camera_id] = time.monotonic() + self.interval(camera_id)
+
+    def stats(self, camera_ids=None):
+        with self._lock:
+            cameras = []
+            for camera_id, reader in sorted(self._readers.items()):
+                if camera_ids is not None and camera_id not in camera_ids:
+                    continue
+                cameras.append({
+                    'camera_id': camera_id,
+                    'connected': reader.connected,
+                    'error': reader.error,
+                    'received': reader.slot.received,
+                    'dropped': reader.slot.dropped,
+                    'stale': reader.slot.stale,
+                    'processed': self._processed.get(camera_id, 0),
+                    'last_error': self._errors.get(camera_id),
+                })
+            return {'running': self.running, 'cameras': cameras}
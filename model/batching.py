@@ -0,0 +1,100 @@
+import collections
+import threading
+import time
+from concurrent.futures import Future
+from concurrent.futures import TimeoutError as FutureTimeout
+
+from model.pool import JobTimeout
+
+
+class _Request:
+    def __init__(self, size):
+        self.future = Future()
+        self.results = {}
+        self.remaining = size
+
+
+class CropBatcher:
+    # Collects window crops from many frames and cameras and sends them to the
+    # OCR pool in batches of batch_size, waiting at most max_wait for a batch to fill
+
+    def __init__(self, pool, batch_size=16, max_wait=0.01):
+        self.pool = pool
+        self.batch_size = batch_size
+        self.max_wait = max_wait
+        self.timeout = pool.timeout + max_wait
+
+        self._queue = collections.deque()
+        self._cond = threading.Condition()
+        self._lock = threading.Lock()
+        self._thread = threading.Thread(target=self._run, name='crop-batcher', daemon=True)
+        self._thread.start()
+
+    def submit(self, items):
+        # Returns a future for {window_id: result} covering this frame's items
+        request = _Request(len(items))
+        if not items:
+            request.future.set_result({})
+            return request.future
+
+        with self._cond:
+            self._queue.extend((request, window_id, crop) for window_id, crop in items)
+            self._cond.notify()
+        return request.future
+
+    def result(self, future):
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeout:
+            raise JobTimeout(f'OCR job took longer than {self.timeout}s')
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._queue:
+                    self._cond.wait()
+
+                # Give other requests a moment to fill up the batch
+                deadline = time.monotonic() + self.max_wait
+                while len(self._queue) < self.batch_size:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+
+                batch = [self._queue.popleft() for _ in range(min(self.batch_size, len(self._queue)))]
+
+            self._dispatch(batch)
+
+    def _dispatch(self, batch):
+        # The same window can appear twice in a batch, so key the job by position
+        items = [(index, crop) for index, (_, _, crop) in enumerate(batch)]
+        try:
+            future = self.pool.submit(items)
+        except Exception as e:
+            self._fail(batch, e)
+            return
+
+        future.add_done_callback(lambda done: self._complete(batch, done))
+
+    def _complete(self, batch, future):
+        if future.cancelled():
+            self._fail(batch, JobTimeout('OCR job was cancelled'))
+            return
+        if future.exception():
+            self._fail(batch, future.exception())
+            return
+
+        results = future.result()
+        with self._lock:
+            for index, (request, window_id, _) in enumerate(batch):
+                request.results[window_id] = results[index]
+                request.remaining -= 1
+                if request.remaining == 0 and not request.future.done():
+                    request.future.set_result(request.results)
+
+    def _fail(self, batch, error):
+        with self._lock:
+            for request, _, _ in batch:
+                if not request.future.done():
+                    request.future.set_exception(error)
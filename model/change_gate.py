@@ -0,0 +1,67 @@
+import threading
+import time
+
+import cv2
+import numpy as np
+
+
+class ChangeGate:
+    # Remembers a tiny thumbnail of the last OCR'd crop per window and hands back
+    # the previous reading while the pixels stay within tolerance
+
+    def __init__(self, tolerance=3.0, refresh_interval=30.0, size=(16, 8)):
+        self.tolerance = tolerance
+        self.refresh_interval = refresh_interval
+        self.size = size
+
+        self._entries = {}  # window_id -> (fingerprint, result, refreshed_at)
+        self._lock = threading.Lock()
+        self.checked = 0
+        self.skipped = 0
+        self.forced_refreshes = 0
+
+    def fingerprint(self, crop):
+        gray = crop if crop.ndim == 2 else cv2.cvtColor(crop, cv2.COLOR_BGR2GRAY)
+        return cv2.resize(gray, self.size, interpolation=cv2.INTER_AREA).astype(np.int16)
+
+    def check(self, window_id, crop):
+        # Returns (fingerprint, cached result or None when the crop needs OCR)
+        fingerprint = self.fingerprint(crop)
+        now = time.monotonic()
+
+        with self._lock:
+            self.checked += 1
+            entry = self._entries.get(window_id)
+            if entry is None:
+                return fingerprint, None
+
+            # Compare with the crop that was actually OCR'd so slow drift still adds up
+            last_fingerprint, result, refreshed_at = entry
+            if np.abs(fingerprint - last_fingerprint).mean() > self.tolerance:
+                return fingerprint, None
+
+            # Unchanged, but re-read now and then so a bad value can't stick around
+            if now - refreshed_at >= self.refresh_interval:
+                self.forced_refreshes += 1
+                return fingerprint, None
+
+            self.skipped += 1
+            return fingerprint, result
+
+    def update(self, window_id, fingerprint, result):
+        with self._lock:
+            self._entries[window_id] = (fingerprint, result, time.monotonic())
+
+    def forget(self, window_id):
+        with self._lock:
+            self._entries.pop(window_id, None)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'checked': self.checked,
+                'skipped': self.skipped,
+                'forced_refreshes': self.forced_refreshes,
+                'skip_ratio': self.skipped / self.checked if self.checked else 0.0,
+                'windows': len(self._entries),
+            }
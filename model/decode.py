@@ -0,0 +1,155 @@
+import io
+import math
+from collections import namedtuple
+
+import cv2
+import numpy as np
+
+# PyTurboJPEG lets a JPEG be cropped before it is decompressed. It needs the
+# libturbojpeg shared library as well, so a failed load just disables it
+try:
+    from turbojpeg import TurboJPEG, TJPF_BGR, tjMCUHeight, tjMCUWidth
+    _turbo = TurboJPEG()
+except (ImportError, OSError, RuntimeError):
+    _turbo = None
+
+# A decoded frame. origin is where image[0, 0] sits in the full size frame and
+# scale is how many full size pixels one decoded pixel covers, so window
+# coordinates (always stored at full size) can be mapped into the image
+Frame = namedtuple('Frame', ['image', 'origin', 'scale'])
+
+# JPEG can skip work while decoding at 1/2, 1/4 and 1/8 of the size, other
+# formats are decoded and then shrunk by OpenCV
+REDUCED_FLAGS = {
+    1: cv2.IMREAD_COLOR,
+    2: cv2.IMREAD_REDUCED_COLOR_2,
+    4: cv2.IMREAD_REDUCED_COLOR_4,
+    8: cv2.IMREAD_REDUCED_COLOR_8,
+}
+
+
+def sniff_format(data):
+    # Uploaded names and extensions can't be trusted ('x.jpg' holding AVIF),
+    # so look at the magic bytes instead
+    head = bytes(data[:16])
+    if head.startswith(b'\xff\xd8\xff'):
+        return 'jpeg'
+    if head.startswith(b'\x89PNG\r\n\x1a\n'):
+        return 'png'
+    if head[:4] == b'RIFF' and head[8:12] == b'WEBP':
+        return 'webp'
+    if head[4:8] == b'ftyp' and head[8:12] in (b'avif', b'avis'):
+        return 'avif'
+    return None
+
+
+def bounding_region(boxes):
+    # (left, top, right, bottom) covering every window box, None without boxes
+    if not boxes:
+        return None
+
+    xs = [int(x) for _, x1, _, x2, _ in boxes for x in (x1, x2)]
+    ys = [int(y) for _, _, y1, _, y2 in boxes for y in (y1, y2)]
+    return max(0, min(xs)), max(0, min(ys)), max(xs), max(ys)
+
+
+def frame_boxes(frame, boxes):
+    # Map full size window boxes into the coordinates of a decoded frame
+    origin_x, origin_y = frame.origin
+    mapped = []
+    for window_id, x1, y1, x2, y2 in boxes:
+        left, right = sorted((int(x1), int(x2)))
+        top, bottom = sorted((int(y1), int(y2)))
+        mapped.append((window_id,
+                       (left - origin_x) // frame.scale,
+                       (top - origin_y) // frame.scale,
+                       math.ceil((right - origin_x) / frame.scale),
+                       math.ceil((bottom - origin_y) / frame.scale)))
+    return mapped
+
+
+def crop_frame(frame, region):
+    # Cut a full size region out of an already decoded frame
+    height, width = frame.image.shape[:2]
+    origin_x, origin_y = frame.origin
+    left, top, right, bottom = region
+
+    left = min(width, max(0, (left - origin_x) // frame.scale))
+    top = min(height, max(0, (top - origin_y) // frame.scale))
+    right = min(width, max(left, math.ceil((right - origin_x) / frame.scale)))
+    bottom = min(height, max(top, math.ceil((bottom - origin_y) / frame.scale)))
+
+    return Frame(frame.image[top:bottom, left:right],
+                 (origin_x + left * frame.scale, origin_y + top * frame.scale),
+                 frame.scale)
+
+
+def decode(data, reduce=1, region=None):
+    # Decode an in-memory image (raw file bytes) into a BGR Frame.
+    # reduce decodes at 1/2, 1/4 or 1/8 of the size for coarse stages and
+    # region limits decoding to a full size (left, top, right, bottom) box
+    # where the format allows it. Returns None if the data can't be decoded
+    if reduce not in REDUCED_FLAGS:
+        raise ValueError('reduce must be one of %s' % sorted(REDUCED_FLAGS))
+
+    image_format = sniff_format(data)
+    if region is not None and image_format == 'jpeg' and _turbo is not None:
+        frame = _decode_jpeg_region(data, reduce, region)
+        if frame is not None:
+            return frame
+
+    image = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), REDUCED_FLAGS[reduce])
+    if image is None:
+        # OpenCV builds without libavif can't read AVIF, Pillow might
+        image = _decode_pillow(data, reduce)
+    if image is None:
+        return None
+
+    frame = Frame(image, (0, 0), reduce)
+    if region is not None:
+        frame = crop_frame(frame, region)
+    return frame
+
+
+def _decode_jpeg_region(data, reduce, region):
+    # Losslessly crop the compressed JPEG to the region and decode only that.
+    # Crops have to start on an MCU boundary, so the origin is rounded down
+    try:
+        width, height, subsample, _ = _turbo.decode_header(data)
+        left, top, right, bottom = region
+        left = max(0, int(left)) // tjMCUWidth[subsample] * tjMCUWidth[subsample]
+        top = max(0, int(top)) // tjMCUHeight[subsample] * tjMCUHeight[subsample]
+        right, bottom = min(width, int(right)), min(height, int(bottom))
+        if right <= left or bottom <= top:
+            return None
+
+        cropped = _turbo.crop(data, left, top, right - left, bottom - top)
+        scaling_factor = (1, reduce) if reduce > 1 else None
+        image = _turbo.decode(cropped, pixel_format=TJPF_BGR, scaling_factor=scaling_factor)
+    except Exception:
+        # Progressive or otherwise unusual JPEGs fall back to a full decode
+        return None
+    return Frame(image, (left, top), reduce)
+
+
+def _decode_pillow(data, reduce):
+    try:
+        from PIL import Image
+    except ImportError:
+        return None
+    try:
+        # Registers AVIF with older Pillow versions that lack it
+        import pillow_avif  # noqa: F401
+    except ImportError:
+        pass
+
+    try:
+        with Image.open(io.BytesIO(data)) as image:
+            size = (max(1, image.width // reduce), max(1, image.height // reduce))
+            image.draft('RGB', size)
+            image = image.convert('RGB')
+            if image.size != size:
+                image = image.resize(size, Image.BOX)
+            return cv2.cvtColor(np.asarray(image), cv2.COLOR_RGB2BGR)
+    except Exception:
+        return None
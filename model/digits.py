@@ -0,0 +1,381 @@
+import cv2
+import numpy as np
+
+from model import montage
+
+# Every glyph is scaled into a cell of this size (keeping its aspect ratio)
+# before it is compared with the templates
+CELL_HEIGHT = 24
+CELL_WIDTH = 16
+
+# Lit segments per digit, including the alternate 6, 7 and 9 some monitors use
+#    a
+#  f   b
+#    g
+#  e   c
+#    d
+SEVEN_SEGMENT_DIGITS = [
+    ('0', 'abcdef'), ('1', 'bc'), ('2', 'abdeg'), ('3', 'abcdg'), ('4', 'bcfg'),
+    ('5', 'acdfg'), ('6', 'acdefg'), ('7', 'abc'), ('8', 'abcdefg'), ('9', 'abcdfg'),
+    ('6', 'cdefg'), ('7', 'abcf'), ('9', 'abcfg'),
+]
+
+# Hershey fonts stand in for the plain sans digits monitors draw
+TEMPLATE_FONTS = [
+    (cv2.FONT_HERSHEY_SIMPLEX, 2),
+    (cv2.FONT_HERSHEY_SIMPLEX, 5),
+    (cv2.FONT_HERSHEY_DUPLEX, 3),
+    (cv2.FONT_HERSHEY_DUPLEX, 6),
+    (cv2.FONT_HERSHEY_TRIPLEX, 3),
+    (cv2.FONT_HERSHEY_PLAIN, 3),
+]
+
+
+def normalize_glyph(mask):
+    # Fit a foreground mask (glyph pixels non-zero) into the cell and turn it
+    # into a zero mean, unit length vector so a dot product is a correlation
+    height, width = mask.shape
+    scale = min(CELL_HEIGHT / height, CELL_WIDTH / width)
+    size = (max(1, round(width * scale)), max(1, round(height * scale)))
+    glyph = cv2.resize(mask.astype(np.float32), size, interpolation=cv2.INTER_AREA)
+
+    cell = np.zeros((CELL_HEIGHT, CELL_WIDTH), dtype=np.float32)
+    left = (CELL_WIDTH - size[0]) // 2
+    top = (CELL_HEIGHT - size[1]) // 2
+    cell[top:top + size[1], left:left + size[0]] = glyph
+
+    # A little blur makes the match forgiving of stroke width and small offsets
+    vector = cv2.GaussianBlur(cell, (3, 3), 0).ravel()
+    vector -= vector.mean()
+    return vector / max(float(np.linalg.norm(vector)), 1e-6)
+
+
+def _trim(mask):
+    rows = np.flatnonzero(mask.any(axis=1))
+    columns = np.flatnonzero(mask.any(axis=0))
+    return mask[rows[0]:rows[-1] + 1, columns[0]:columns[-1] + 1]
+
+
+def _seven_segment(segments, thickness, shear):
+    height, width, gap = 64, 36, 2
+    middle = height // 2
+    canvas = np.zeros((height, width + 16), dtype=np.uint8)
+    rectangles = {
+        'a': (thickness + gap, 0, width - thickness - gap, thickness),
+        'b': (width - thickness, thickness + gap, width, middle - gap),
+        'c': (width - thickness, middle + gap, width, height - thickness - gap),
+        'd': (thickness + gap, height - thickness, width - thickness - gap, height),
+        'e': (0, middle + gap, thickness, height - thickness - gap),
+        'f': (0, thickness + gap, thickness, middle - gap),
+        'g': (thickness + gap, middle - thickness // 2, width - thickness - gap, middle + thickness // 2),
+    }
+    for segment in segments:
+        left, top, right, bottom = rectangles[segment]
+        canvas[top:bottom, left + 8:right + 8] = 255
+
+    if shear:
+        # Italic displays lean the digits to the right
+        matrix = np.float32([[1, -shear, shear * height], [0, 1, 0]])
+        canvas = cv2.warpAffine(canvas, matrix, (canvas.shape[1], height))
+    return canvas
+
+
+def build_templates():
+    # Returns (vectors, labels), one row per rendered template glyph
+    masks, labels = [], []
+
+    for digit, segments in SEVEN_SEGMENT_DIGITS:
+        for thickness in (6, 10):
+            for shear in (0, 0.12):
+                masks.append(_seven_segment(segments, thickness, shear))
+                labels.append(digit)
+
+    for font, thickness in TEMPLATE_FONTS:
+        for digit in '0123456789':
+            canvas = np.zeros((96, 80), dtype=np.uint8)
+            cv2.putText(canvas, digit, (8, 80), font, 2.2, 255, thickness, cv2.LINE_AA)
+            masks.append(canvas)
+            labels.append(digit)
+
+    vectors = np.stack([normalize_glyph(_trim(mask > 127)) for mask in masks])
+    return vectors, np.array(labels)
+
+
+def _groups(count, pairs):
+    # Union-find over count items, returns the index arrays of the joined groups
+    parents = list(range(count))
+
+    def find(index):
+        while parents[index] != index:
+            parents[index] = parents[parents[index]]
+            index = parents[index]
+        return index
+
+    for first, second in pairs:
+        parents[find(first)] = find(second)
+
+    groups = {}
+    for index in range(count):
+        groups.setdefault(find(index), []).append(index)
+    return [np.array(group) for group in groups.values()]
+
+
+class DigitClassifier:
+    # Small template matcher for the digit fonts patient monitors use. It
+    # splits a window crop into characters and matches each one against
+    # rendered seven-segment and sans digits, which takes well under a
+    # millisecond per window on one core
+
+    def __init__(self, min_score=0.5, max_height=64):
+        # Glyphs scoring below min_score (units, labels) are left out of the text
+        self.min_score = min_score
+        self.max_height = max_height
+        self.templates, self.labels = build_templates()
+
+    def read_batch(self, crops):
+        # Returns [(text, confidence)] per crop. Every crop is segmented first
+        # so all of their glyphs are matched in one product
+        layouts = [self.segment(crop) for crop in crops]
+        glyphs = [glyph for layout in layouts for kind, glyph in layout if kind is None]
+        if glyphs:
+            scores = np.stack(glyphs) @ self.templates.T
+            best = scores.argmax(axis=1)
+            matches = iter(zip(self.labels[best], scores[np.arange(len(best)), best]))
+
+        texts = []
+        for layout in layouts:
+            characters, confidences = [], []
+            for kind, glyph in layout:
+                if kind is None:
+                    kind, score = next(matches)
+                    if score < self.min_score:
+                        continue
+                    confidences.append(float(score))
+                characters.append(str(kind))
+
+            text = ''.join(characters)
+            if not confidences:
+                texts.append(('', 0.0))
+            else:
+                texts.append((text, min(confidences)))
+        return texts
+
+    def detect(self, image, max_candidates=1500):
+        # Full frame search: blobs of either polarity are joined into glyphs,
+        # glyph sized ones into words with their neighbours and every word box
+        # is read. Returns [((left, top, right, bottom), text, confidence)]
+        gray = image if image.ndim == 2 else cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+        height, width = gray.shape
+
+        boxes = []
+        for polarity in (cv2.THRESH_BINARY, cv2.THRESH_BINARY_INV):
+            _, mask = cv2.threshold(gray, 0, 255, polarity + cv2.THRESH_OTSU)
+            _, _, stats, _ = cv2.connectedComponentsWithStats(mask, connectivity=8)
+            stats = stats[1:]
+            # Backgrounds are too big to be part of a glyph and specks too small
+            stats = stats[(stats[:, cv2.CC_STAT_WIDTH] <= width // 3) & (stats[:, cv2.CC_STAT_HEIGHT] <= height // 3)
+                          & (stats[:, cv2.CC_STAT_AREA] >= 4)]
+            # Photos can be full of small blobs, the biggest ones are the likely digits
+            stats = stats[np.argsort(-stats[:, cv2.CC_STAT_AREA])[:max_candidates]]
+            left, top = stats[:, cv2.CC_STAT_LEFT], stats[:, cv2.CC_STAT_TOP]
+            components = np.stack([left, top, left + stats[:, cv2.CC_STAT_WIDTH],
+                                   top + stats[:, cv2.CC_STAT_HEIGHT]], axis=1)
+
+            # The bars of a seven-segment digit are separate blobs and far too
+            # thin to pass for text alone, the size limits only apply once
+            # they are back together
+            glyphs = self._join(components, 0.5, 0.35)
+            glyphs = glyphs[(glyphs[:, 3] - glyphs[:, 1] >= 10) & (glyphs[:, 3] - glyphs[:, 1] <= height // 3)
+                            & (glyphs[:, 2] - glyphs[:, 0] <= width // 3)]
+            # A 1 sits at the right of a digit wide cell on seven-segment and
+            # tabular displays, so it is joined as if it filled the cell. Thick
+            # segments leave wide gaps too, still narrower than the space
+            # between two separate readings
+            cells = glyphs.copy()
+            narrow = cells[:, 2] - cells[:, 0] < (cells[:, 3] - cells[:, 1]) * 0.4
+            cells[narrow, 0] = np.maximum(0, cells[narrow, 2] - (cells[narrow, 3] - cells[narrow, 1]) * 0.6)
+            boxes.extend(tuple(int(value) for value in box) for box in self._join(cells, 0.8, 0.2))
+
+        # A margin around every word, the segmentation needs background on all sides
+        padded = []
+        for left, top, right, bottom in boxes:
+            margin = max(2, round((bottom - top) * 0.15))
+            padded.append((max(0, left - margin), max(0, top - margin),
+                           min(width, right + margin), min(height, bottom + margin)))
+        boxes = padded
+        crops = [image[top:bottom, left:right] for left, top, right, bottom in boxes]
+        detections = []
+        for box, (text, confidence) in zip(boxes, self.read_batch(crops)):
+            if text.strip('.-'):
+                detections.append((box, text, confidence))
+        return detections
+
+    @staticmethod
+    def _join(boxes, across, down):
+        # Union (left, top, right, bottom) boxes whose horizontal and vertical
+        # gaps are below these shares of the taller one's height, returns the
+        # bounding boxes of the groups
+        if not len(boxes):
+            return np.zeros((0, 4), dtype=np.int64)
+        left, top, right, bottom = boxes.T
+
+        gap_x = np.maximum(left[:, None], left[None, :]) - np.minimum(right[:, None], right[None, :])
+        gap_y = np.maximum(top[:, None], top[None, :]) - np.minimum(bottom[:, None], bottom[None, :])
+        tallest = np.maximum((bottom - top)[:, None], (bottom - top)[None, :])
+        close = (gap_x < tallest * across) & (gap_y < tallest * down)
+
+        groups = _groups(len(boxes), zip(*np.nonzero(np.triu(close, 1))))
+        return np.array([(left[group].min(), top[group].min(), right[group].max(), bottom[group].max())
+                         for group in groups])
+
+    @staticmethod
+    def _characters(stats, text_height, line_bottom):
+        # Group components into characters: the segments of a seven-segment
+        # digit are only a sliver of background apart horizontally, while
+        # separate characters leave a wider gap or would make one too wide
+        left = stats[:, cv2.CC_STAT_LEFT]
+        right = left + stats[:, cv2.CC_STAT_WIDTH]
+        width = stats[:, cv2.CC_STAT_WIDTH]
+        height = stats[:, cv2.CC_STAT_HEIGHT]
+        bottom = stats[:, cv2.CC_STAT_TOP] + height
+
+        short = height < text_height * 0.35
+        # Decimal points and minus signs must stay characters of their own. A
+        # point sits on the baseline, which the lower side bars e and c don't
+        point = (height < text_height * 0.25) & (width < text_height * 0.25) & \
+            (line_bottom - bottom < text_height * 0.1)
+        tolerance = max(1.0, text_height * 0.12)
+        gap = np.maximum(left[:, None], left[None, :]) - np.minimum(right[:, None], right[None, :])
+        np.fill_diagonal(gap, tolerance + 1)
+        # A minus is a bar at mid height with no other part above or below it,
+        # unlike segments a, g and d stacked in a 3
+        middle = np.abs(bottom - height / 2 - (line_bottom - text_height / 2)) < text_height * 0.2
+        dash = short & ~point & (width > height * 1.5) & middle & ~(gap < 0).any(axis=1)
+        span = np.maximum(right[:, None], right[None, :]) - np.minimum(left[:, None], left[None, :])
+        # Overlapping columns always belong together (e.g. segment d under a and g)
+        close = (gap < 0) | ((gap <= tolerance) & (span <= text_height * 0.9)
+                             & ~point[:, None] & ~point[None, :] & ~dash[:, None] & ~dash[None, :])
+
+        # A middle bar is segment g when it sits between two close parts, as
+        # in a 4, and a minus sign otherwise
+        for index in np.flatnonzero(dash):
+            before = np.flatnonzero((gap[index] <= tolerance) & (right <= left[index]) & ~dash)
+            after = np.flatnonzero((gap[index] <= tolerance) & (left >= right[index]) & ~dash)
+            if len(before) and len(after):
+                close[index, before] = close[index, after] = True
+
+        pairs = zip(*np.nonzero(np.triu(close | close.T, 1)))
+        return sorted(_groups(len(stats), pairs), key=lambda group: left[group].min())
+
+    def segment(self, crop):
+        # Split a crop into [(character, None)] for '.' and '-' found by shape
+        # and [(None, vector)] for glyphs that still need classifying
+        gray = crop if crop.ndim == 2 else cv2.cvtColor(crop, cv2.COLOR_BGR2GRAY)
+        if gray.shape[0] > self.max_height:
+            width = max(1, round(gray.shape[1] * self.max_height / gray.shape[0]))
+            gray = cv2.resize(gray, (width, self.max_height), interpolation=cv2.INTER_AREA)
+
+        _, mask = cv2.threshold(gray, 0, 1, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+        # The background is whatever covers most of the border
+        border = np.concatenate((mask[0], mask[-1], mask[:, 0], mask[:, -1]))
+        if border.mean() > 0.5:
+            mask = 1 - mask
+
+        # Drop specks, seven-segment digits are several components so the rest
+        # are grouped into characters below
+        count, labels, stats, _ = cv2.connectedComponentsWithStats(mask, connectivity=8)
+        # Relative to the height only, a long line of digits must not make
+        # its decimal points count as specks
+        min_area = max(3, mask.shape[0] ** 2 // 400)
+        components = [index for index in range(1, count) if stats[index, cv2.CC_STAT_AREA] >= min_area]
+        if not components:
+            return []
+        stats = stats[components]
+        rows = np.flatnonzero(np.isin(labels, components).any(axis=1))
+        text_height = rows[-1] - rows[0] + 1
+
+        boxes = []
+        for group in self._characters(stats, text_height, rows[-1] + 1):
+            character = np.isin(labels, [components[index] for index in group]).astype(np.uint8)
+            columns = np.flatnonzero(character.any(axis=0))
+            runs = [(columns[0], columns[-1] + 1)]
+
+            # Anti-aliased digits can touch, cut runs too wide for one digit at
+            # their thinnest column
+            while runs:
+                left, right = runs.pop()
+                if right - left > max(text_height * 1.2, 4):
+                    profile = character[:, left:right].sum(axis=0)
+                    margin = (right - left) // 4
+                    cut = left + margin + int(profile[margin:-margin].argmin())
+                    runs += [(left, cut), (cut, right)]
+                    continue
+                character_rows = np.flatnonzero(character[:, left:right].any(axis=1))
+                if len(character_rows):
+                    boxes.append((left, character_rows[0], right, character_rows[-1] + 1, character))
+        boxes.sort(key=lambda box: box[:4])
+
+        line_height = max(bottom - top for _, top, _, bottom, _ in boxes)
+        line_bottom = max(bottom for _, _, _, bottom, _ in boxes)
+        layout = []
+        for left, top, right, bottom, character in boxes:
+            height, width = bottom - top, right - left
+            if height < line_height * 0.35:
+                if line_bottom - bottom < line_height * 0.2 and width < line_height * 0.4:
+                    layout.append(('.', None))
+                elif width > height * 1.5 and line_bottom - bottom > line_height * 0.25:
+                    layout.append(('-', None))
+                continue
+            if height < line_height * 0.6:
+                # Superscripts, unit marks and other clutter next to the number
+                continue
+            layout.append((None, normalize_glyph(character[top:bottom, left:right])))
+        return layout
+
+
+def _render_seven_segment(text, thickness, scale):
+    # A line of seven-segment digits like a monitor draws them, light on black
+    segments = dict(SEVEN_SEGMENT_DIGITS[:10])
+    image = np.hstack([_seven_segment(segments[digit], thickness, 0) for digit in text])
+    image = cv2.copyMakeBorder(image, 10, 10, 10, 10, cv2.BORDER_CONSTANT, value=0)
+    return cv2.resize(image, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+
+
+def check():
+    # Every seven-segment digit alone and in one line has to read back
+    # exactly, as a window crop, found by detect in a full frame and from a
+    # montage of crops (OCR_MONTAGE) in either polarity
+    classifier = DigitClassifier()
+    texts = list('0123456789') + ['0123456789', '88', '120', '98', '37', '41', '17']
+    failures = []
+    for thickness in (6, 10):
+        for scale in (1.0, 0.5):
+            for text in texts:
+                image = _render_seven_segment(text, thickness, scale)
+                read, _ = classifier.read_batch([image])[0]
+                if read != text:
+                    failures.append(f'{text!r} read as {read!r} (thickness {thickness}, scale {scale})')
+
+                frame = np.zeros((400, 600), dtype=np.uint8)
+                frame[100:100 + image.shape[0], 50:50 + image.shape[1]] = image
+                found = [found_text for _, found_text, _ in classifier.detect(frame)]
+                if found != [text]:
+                    failures.append(f'{text!r} detected as {found!r} (thickness {thickness}, scale {scale})')
+
+            for invert in (False, True):
+                crops = [_render_seven_segment(text, thickness, scale) for text in texts]
+                if invert:
+                    crops = [255 - crop for crop in crops]
+                canvas = montage.Montage(crops)
+                for text, (read, _) in zip(texts, canvas.assign(classifier.detect(canvas.canvas))):
+                    if read != text:
+                        failures.append(f'{text!r} read from a montage as {read!r} '
+                                        f'(thickness {thickness}, scale {scale}, inverted {invert})')
+    return failures
+
+
+if __name__ == '__main__':
+    #   python -m model.digits
+    failures = check()
+    print('\n'.join(failures) or 'All seven-segment digits read back')
+    raise SystemExit(1 if failures else 0)
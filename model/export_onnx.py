@@ -0,0 +1,176 @@
+# Exports easyocr's English recognition network to ONNX for the 'onnx' OCR
+# engine, with an int8 dynamically quantized copy, and checks both against the
+# PyTorch model on text found in the model/data images.
+#
+#   python -m model.export_onnx                  (model/recognizer.onnx and model/recognizer.int8.onnx)
+#   python -m model.export_onnx --no-quantize --no-validate
+#
+# Needs torch and easyocr for the export, onnx and onnxruntime for quantizing
+# and running. Serving with OCR_ENGINE=onnx only needs onnxruntime.
+import argparse
+import json
+import os
+import time
+
+from model.onnx_recognizer import metadata_path
+
+DATA_DIR = os.path.join('model', 'data')
+LABELS_PATH = os.path.join(DATA_DIR, 'labels.json')
+OUTPUT_PATH = os.path.join('model', 'recognizer.onnx')
+
+
+def load_reader():
+    import easyocr
+
+    # Not quantized, torch's dynamically quantized layers can't be exported
+    return easyocr.Reader(['en'], gpu=False, quantize=False)
+
+
+def export(reader, output_path, opset=13):
+    import torch
+    from easyocr import easyocr as easyocr_module
+
+    class Recognizer(torch.nn.Module):
+        # The CTC networks ignore the text argument easyocr passes with the image
+        def __init__(self, model):
+            super().__init__()
+            self.model = model
+
+        def forward(self, image):
+            return self.model(image, None)
+
+    height = easyocr_module.imgH
+    model = Recognizer(reader.recognizer).eval()
+    sample = torch.rand(2, 1, height, 256) * 2 - 1
+    with torch.no_grad():
+        torch.onnx.export(model, sample, output_path,
+                          input_names=['image'], output_names=['logits'],
+                          # Any batch size and crop width, the height is fixed by the model
+                          dynamic_axes={'image': {0: 'batch', 3: 'width'}, 'logits': {0: 'batch', 1: 'steps'}},
+                          opset_version=opset, do_constant_folding=True)
+
+    write_metadata(output_path, {
+        'characters': list(reader.converter.character),
+        'ignore': [int(index) for index in reader.converter.ignore_idx],
+        'height': height,
+    })
+
+    import onnx
+    onnx.checker.check_model(onnx.load(output_path))
+
+
+def write_metadata(model_path, metadata):
+    with open(metadata_path(model_path), 'w') as metadata_file:
+        json.dump(metadata, metadata_file, ensure_ascii=False)
+
+
+def quantize(input_path, output_path):
+    # int8 weights, activations are quantized on the fly at run time
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+
+    quantize_dynamic(input_path, output_path, weight_type=QuantType.QInt8)
+    with open(metadata_path(input_path)) as metadata_file:
+        write_metadata(output_path, json.load(metadata_file))
+
+
+def collect_crops(reader, data_dir, labels_path):
+    # (crop, expected value or None) for every labelled window and every box
+    # easyocr's detector finds in the corpus
+    from model import decode, ocr
+
+    labels = {}
+    if os.path.exists(labels_path):
+        with open(labels_path) as labels_file:
+            labels = json.load(labels_file)
+
+    crops = []
+    for name in sorted(os.listdir(data_dir)):
+        path = os.path.join(data_dir, name)
+        with open(path, 'rb') as image_file:
+            frame = decode.decode(image_file.read())
+        if frame is None:
+            continue
+        image = frame.image
+
+        windows = labels.get(name, {}).get('windows', [])
+        for index, crop in ocr.crop_windows(image, [(index, *window['box']) for index, window in enumerate(windows)]):
+            crops.append((crop, float(windows[index]['value'])))
+
+        horizontal, _ = reader.detect(image)
+        boxes = [(None, x_min, y_min, x_max, y_max) for x_min, x_max, y_min, y_max in horizontal[0]]
+        crops.extend((crop, None) for _, crop in ocr.crop_windows(image, boxes))
+    return crops
+
+
+def validate(reader, model_paths, crops):
+    # Agreement with the PyTorch recognizer, accuracy on labelled windows and
+    # latency per crop for PyTorch and every exported model
+    from model.ocr import DIGITS, parse_value
+    from model.onnx_recognizer import OnnxRecognizer
+
+    def read_torch(crop):
+        height, width = crop.shape[:2]
+        results = reader.recognize(crop, horizontal_list=[[0, width, 0, height]], free_list=[],
+                                   allowlist=DIGITS, detail=1)
+        return results[0][1] if results else ''
+
+    runners = [('torch', read_torch)]
+    for path in model_paths:
+        recognizer = OnnxRecognizer(path, allowlist=DIGITS)
+        runners.append((os.path.basename(path), lambda crop, recognizer=recognizer: recognizer.read_batch([crop])[0][0]))
+
+    reference = None
+    rows = []
+    for name, read in runners:
+        texts = []
+        started = time.perf_counter()
+        for crop, _ in crops:
+            texts.append(read(crop))
+        elapsed = time.perf_counter() - started
+        if reference is None:
+            reference = texts
+
+        labelled = [(parse_value(text), expected) for text, (_, expected) in zip(texts, crops) if expected is not None]
+        rows.append({
+            'model': name,
+            'crops': len(crops),
+            'ms_per_crop': elapsed / max(len(crops), 1) * 1000,
+            'agreement': sum(text == expected for text, expected in zip(texts, reference)) / max(len(crops), 1),
+            'accuracy': sum(value == expected for value, expected in labelled) / len(labelled) if labelled else None,
+        })
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export easyocr's recognizer to ONNX")
+    parser.add_argument('--output', default=OUTPUT_PATH)
+    parser.add_argument('--opset', type=int, default=13)
+    parser.add_argument('--no-quantize', action='store_true', help='skip the int8 copy')
+    parser.add_argument('--no-validate', action='store_true', help='skip the comparison on model/data')
+    parser.add_argument('--data', default=DATA_DIR)
+    parser.add_argument('--labels', default=LABELS_PATH)
+    args = parser.parse_args()
+
+    reader = load_reader()
+    export(reader, args.output, opset=args.opset)
+    model_paths = [args.output]
+    print(f'Exported {args.output}')
+
+    if not args.no_quantize:
+        quantized_path = os.path.splitext(args.output)[0] + '.int8.onnx'
+        quantize(args.output, quantized_path)
+        model_paths.append(quantized_path)
+        print(f'Quantized {quantized_path}')
+
+    if not args.no_validate:
+        crops = collect_crops(reader, args.data, args.labels)
+        for row in validate(reader, model_paths, crops):
+            accuracy = '-' if row['accuracy'] is None else f'{row["accuracy"]:.3f}'
+            size = '' if row['model'] == 'torch' else \
+                f'  {os.path.getsize(os.path.join(os.path.dirname(args.output), row["model"])) / 1e6:.1f} MB'
+            print(f'{row["model"]:<24} {row["ms_per_crop"]:8.2f} ms/crop  agreement {row["agreement"]:.3f}  '
+                  f'accuracy {accuracy}{size}')
+
+
+if __name__ == '__main__':
+    main()
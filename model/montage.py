@@ -0,0 +1,110 @@
+import math
+
+import cv2
+import numpy as np
+
+
+def _shelves(sizes, order, width, padding):
+    # Next fit shelves, tallest tiles first so each shelf wastes little height
+    positions = [None] * len(sizes)
+    x = y = padding
+    shelf_height = 0
+    right = 0
+    for index in order:
+        tile_width, tile_height = sizes[index]
+        if x > padding and x + tile_width + padding > width:
+            y += shelf_height + padding
+            x = padding
+            shelf_height = 0
+        positions[index] = (x, y)
+        x += tile_width + padding
+        right = max(right, x)
+        shelf_height = max(shelf_height, tile_height)
+    return positions, (right, y + shelf_height + padding)
+
+
+def pack(sizes, padding):
+    # Places (width, height) tiles on the smallest canvas found among shelf
+    # layouts of one to len(sizes) rows, padding pixels around every tile.
+    # Returns [(left, top)] per tile and the (width, height) of the canvas
+    if not sizes:
+        return [], (0, 0)
+
+    order = sorted(range(len(sizes)), key=lambda index: (-sizes[index][1], -sizes[index][0]))
+    total_width = sum(width + padding for width, _ in sizes) + padding
+    widest = max(width for width, _ in sizes) + 2 * padding
+
+    best = None
+    for rows in range(1, len(sizes) + 1):
+        positions, (width, height) = _shelves(sizes, order, max(widest, math.ceil(total_width / rows)), padding)
+        # Smallest area, then the squarest
+        score = (width * height, abs(width - height))
+        if best is None or score < best[0]:
+            best = (score, positions, (width, height))
+    return best[1], best[2]
+
+
+def _inside(inner, outer):
+    return (inner != outer and outer[0] <= inner[0] and outer[1] <= inner[1]
+            and inner[2] <= outer[2] and inner[3] <= outer[3])
+
+
+class Montage:
+    # Window crops, possibly from several frames, drawn dark on light on one
+    # white canvas so an engine can find all of them in a single detect pass.
+    # The gap between tiles is a share of the tallest crop, wide enough that
+    # detectors don't merge numbers from neighbouring tiles into one box
+
+    def __init__(self, crops, padding=1.0):
+        grays = []
+        for crop in crops:
+            gray = crop if crop.ndim == 2 else cv2.cvtColor(crop, cv2.COLOR_BGR2GRAY)
+            # Full contrast with light digits on a dark screen flipped, so every
+            # tile's background blends into the white canvas
+            gray = cv2.normalize(gray, None, 0, 255, cv2.NORM_MINMAX)
+            border = np.concatenate((gray[0], gray[-1], gray[:, 0], gray[:, -1]))
+            if border.mean() < 128:
+                gray = 255 - gray
+            grays.append(gray)
+
+        self.padding = max(4, round(max((gray.shape[0] for gray in grays), default=0) * padding))
+        positions, (width, height) = pack([(gray.shape[1], gray.shape[0]) for gray in grays], self.padding)
+
+        self.canvas = np.full((height, width), 255, dtype=np.uint8)
+        self.boxes = []  # (left, top, right, bottom) of every crop on the canvas
+        for gray, (left, top) in zip(grays, positions):
+            crop_height, crop_width = gray.shape
+            self.canvas[top:top + crop_height, left:left + crop_width] = gray
+            self.boxes.append((left, top, left + crop_width, top + crop_height))
+
+    def tile_at(self, x, y):
+        # Index of the crop whose tile, including half the gap around it, holds the point
+        margin = self.padding / 2
+        for index, (left, top, right, bottom) in enumerate(self.boxes):
+            if left - margin <= x < right + margin and top - margin <= y < bottom + margin:
+                return index
+        return None
+
+    def assign(self, detections):
+        # Detections on the canvas back to (text, confidence) per crop. A box
+        # belongs to the tile its centre falls in, several boxes in one tile
+        # are joined left to right and keep the lowest confidence
+        words = [[] for _ in self.boxes]
+        for box, text, confidence in detections:
+            index = self.tile_at((box[0] + box[2]) / 2, (box[1] + box[3]) / 2)
+            if index is not None and text.strip():
+                words[index].append((tuple(box), text.strip(), confidence))
+
+        texts = []
+        for tile_words in words:
+            # Boxes nested in another one are parts of it, e.g. the hole of a 6
+            # picked up as a 0 by a detector that tries both polarities
+            tile_words = [word for word in tile_words
+                          if not any(_inside(word[0], other[0]) for other in tile_words)]
+            if not tile_words:
+                texts.append(('', 0.0))
+                continue
+            tile_words.sort(key=lambda word: word[0][0])
+            texts.append((''.join(text for _, text, _ in tile_words),
+                          min(confidence for _, _, confidence in tile_words)))
+        return texts
@@ -1,21 +1,29 @@
+# Run from the repository root with either of
+#   python -m model.new.two
+#   python model/new/two.py
+import os
+import sys
+
 import cv2
-import pytesseract
+
+# Run as a file only this script's folder is on the path, the model package lives two levels up
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+
+from model.ocr import TesseractEngine  # noqa: E402
 
 # Load the image
 image_path = 'test_image.jpg'
 image = cv2.imread(image_path)
 
-# Configure Tesseract to recognize only digits
-custom_config = r'--oem 3 --psm 6 -c tessedit_char_whitelist=0123456789'
-detected_text = pytesseract.image_to_string(image, config=custom_config)
+# Digits only Tesseract, kept loaded so text and boxes come from one pass
+engine = TesseractEngine()
+words = engine.detect(image)
 
-print("Detected Numbers:", detected_text)
+print("Detected Numbers:", ' '.join(text for _, text, _ in words))
 
 # Optional: Draw bounding boxes
-data = pytesseract.image_to_data(image, config=custom_config, output_type=pytesseract.Output.DICT)
-for i in range(len(data['text'])):
-    if data['text'][i].strip().isdigit():
-        x, y, w, h = data['left'][i], data['top'][i], data['width'][i], data['height'][i]
-        cv2.rectangle(image, (x, y), (x + w, y + h), (0, 255, 0), 2)
+for (x1, y1, x2, y2), text, _ in words:
+    if text.isdigit():
+        cv2.rectangle(image, (x1, y1), (x2, y2), (0, 255, 0), 2)
 cv2.imshow('Detected Numbers', image)
 cv2.waitKey(0)
@@ -0,0 +1,248 @@
+import math
+import re
+
+import cv2
+
+from model import digits, montage, onnx_recognizer, tesseract_api
+
+# Characters a monitor reading can contain
+DIGITS = '0123456789.'
+
+# First number in the recognized text, e.g. '98', '36.6' or '-2'
+NUMBER_PATTERN = re.compile(r'-?\d+(?:\.\d+)?')
+
+
+def parse_value(text):
+    # Turn recognized text into a float, None if there is no number in it
+    if not text:
+        return None
+
+    match = NUMBER_PATTERN.search(text.replace(',', '.'))
+    if not match:
+        return None
+    return float(match.group())
+
+
+def bounding_rect(points):
+    # (left, top, right, bottom) of a polygon such as an easyocr box
+    xs = [int(point[0]) for point in points]
+    ys = [int(point[1]) for point in points]
+    return min(xs), min(ys), max(xs), max(ys)
+
+
+def window_box(window):
+    # Plain tuple version of a Window so it can be sent to other processes
+    return (window.id,
+            window.top_left_x,
+            window.top_left_y,
+            window.bottom_right_x,
+            window.bottom_right_y)
+
+
+def crop_windows(image, boxes):
+    # Cut each window rectangle out of the frame, skipping empty ones
+    height, width = image.shape[:2]
+
+    items = []
+    for window_id, x1, y1, x2, y2 in boxes:
+        # Corners may have been entered in either order, so sort and clamp them
+        left, right = sorted((int(x1), int(x2)))
+        top, bottom = sorted((int(y1), int(y2)))
+        left, right = max(0, left), min(width, right)
+        top, bottom = max(0, top), min(height, bottom)
+
+        if right - left < 1 or bottom - top < 1:
+            continue
+        items.append((window_id, image[top:bottom, left:right]))
+
+    return items
+
+
+class Engine:
+    name = None
+
+    def read(self, crop):
+        # Returns (text, confidence) for a single window crop
+        raise NotImplementedError
+
+    def read_batch(self, crops):
+        return [self.read(crop) for crop in crops]
+
+    def detect(self, image):
+        # Full frame text detection, returns [((left, top, right, bottom), text, confidence)]
+        raise NotImplementedError
+
+
+class EasyOCREngine(Engine):
+    name = 'easyocr'
+
+    def __init__(self, gpu=False, allowlist=DIGITS):
+        import easyocr
+        from easyocr import easyocr as easyocr_module
+
+        self.reader = easyocr.Reader(['en'], gpu=gpu)
+        self.allowlist = allowlist
+        self.height = easyocr_module.imgH
+        # What reader.recognize drops for an allowlist, every other character
+        self.ignore_char = ''.join(set(self.reader.character) - set(allowlist)) if allowlist else ''
+
+    def read(self, crop):
+        return self.read_batch([crop])[0]
+
+    def read_batch(self, crops):
+        # Windows are already known boxes, so skip the text detector and hand
+        # every crop to the recognizer as one padded batch. reader.recognize
+        # would run one forward pass per box on the CPU
+        from easyocr.recognition import get_text
+
+        if not crops:
+            return []
+        image_list = []
+        for index, crop in enumerate(crops):
+            gray = crop if crop.ndim == 2 else cv2.cvtColor(crop, cv2.COLOR_BGR2GRAY)
+            height, width = gray.shape
+            width = max(1, math.ceil(self.height * width / height))
+            interpolation = cv2.INTER_CUBIC if height < self.height else cv2.INTER_AREA
+            # The box slot only carries the crop's index through get_text
+            image_list.append((index, cv2.resize(gray, (width, self.height), interpolation=interpolation)))
+
+        results = get_text(self.reader.character, self.height, max(image.shape[1] for _, image in image_list),
+                           self.reader.recognizer, self.reader.converter, image_list,
+                           ignore_char=self.ignore_char, decoder='greedy', beamWidth=5,
+                           batch_size=len(image_list), contrast_ths=0.1, adjust_contrast=0.5,
+                           filter_ths=0.003, workers=0, device=self.reader.device)
+
+        texts = [('', 0.0)] * len(crops)
+        for index, text, confidence in results:
+            texts[index] = (text, float(confidence))
+        return texts
+
+    def detect(self, image):
+        results = self.reader.readtext(image, allowlist=self.allowlist, detail=1)
+        return [(bounding_rect(box), text, float(confidence)) for box, text, confidence in results]
+
+
+class TesseractEngine(Engine):
+    # Digits only. Runs in process through tesserocr when it is installed,
+    # see model/tesseract_api.py
+    name = 'tesseract'
+
+    def __init__(self, lang='eng', tessdata=None, whitelist=DIGITS):
+        self.tesseract = tesseract_api.load(lang=lang, tessdata=tessdata, whitelist=whitelist)
+
+    def read(self, crop):
+        words = self.tesseract.words(crop, psm=tesseract_api.PSM_SINGLE_LINE)
+        if not words:
+            return '', 0.0
+        return ''.join(text for _, text, _ in words), min(confidence for _, _, confidence in words)
+
+    def detect(self, image):
+        return self.tesseract.words(image, psm=tesseract_api.PSM_SPARSE_TEXT)
+
+
+class DigitEngine(Engine):
+    name = 'digits'
+
+    def __init__(self, min_score=0.5, max_height=64):
+        self.classifier = digits.DigitClassifier(min_score=min_score, max_height=max_height)
+
+    def read(self, crop):
+        return self.classifier.read_batch([crop])[0]
+
+    def read_batch(self, crops):
+        return self.classifier.read_batch(crops)
+
+    def detect(self, image):
+        return self.classifier.detect(image)
+
+
+class OnnxEngine(Engine):
+    # easyocr's recognizer exported by model/export_onnx.py, without torch
+    name = 'onnx'
+
+    def __init__(self, model_path=onnx_recognizer.DEFAULT_MODEL_PATH, threads=1, allowlist=DIGITS):
+        self.recognizer = onnx_recognizer.OnnxRecognizer(model_path, threads=threads, allowlist=allowlist)
+        self.detector = None
+
+    def read(self, crop):
+        return self.recognizer.read_batch([crop])[0]
+
+    def read_batch(self, crops):
+        return self.recognizer.read_batch(crops)
+
+    def detect(self, image):
+        # Text detection still needs easyocr's detector, it is only loaded
+        # when a full frame is searched (window proposals)
+        if self.detector is None:
+            import easyocr
+
+            self.detector = easyocr.Reader(['en'], gpu=False, recognizer=False)
+
+        horizontal, free = self.detector.detect(image)
+        boxes = [(x_min, y_min, x_max, y_max) for x_min, x_max, y_min, y_max in horizontal[0]]
+        boxes += [bounding_rect(points) for points in free[0]]
+
+        height, width = image.shape[:2]
+        boxes = [(max(0, int(left)), max(0, int(top)), min(width, int(right)), min(height, int(bottom)))
+                 for left, top, right, bottom in boxes]
+        boxes = [box for box in boxes if box[2] > box[0] and box[3] > box[1]]
+
+        texts = self.read_batch([image[top:bottom, left:right] for left, top, right, bottom in boxes])
+        return [(box, text, confidence) for box, (text, confidence) in zip(boxes, texts)]
+
+
+class MontageEngine(Engine):
+    # Wraps another engine so a batch of crops is packed onto one canvas and
+    # read with a single detect pass, see model/montage.py. Pays off when the
+    # fixed cost of an engine call outweighs the extra detection work. Only as
+    # good as the engine's detect, python -m model.digits compares the digits
+    # engine's montage reads with its per-crop ones
+    def __init__(self, engine, padding=1.0):
+        self.engine = engine
+        self.name = engine.name
+        self.padding = padding
+
+    def read(self, crop):
+        return self.read_batch([crop])[0]
+
+    def read_batch(self, crops):
+        if not crops:
+            return []
+        canvas = montage.Montage(crops, padding=self.padding)
+        return canvas.assign(self.engine.detect(canvas.canvas))
+
+    def detect(self, image):
+        return self.engine.detect(image)
+
+
+ENGINES = {
+    EasyOCREngine.name: EasyOCREngine,
+    TesseractEngine.name: TesseractEngine,
+    DigitEngine.name: DigitEngine,
+    OnnxEngine.name: OnnxEngine,
+}
+
+
+def create_engine(name, **options):
+    if name not in ENGINES:
+        raise ValueError(f'Unknown OCR engine: {name}')
+    return ENGINES[name](**options)
+
+
+def read_windows(engine, items, batch_size=16, preprocessor=None):
+    # Recognize every (window_id, crop) pair in fixed size batches and parse the numeric reading
+    results = {}
+    for start in range(0, len(items), batch_size):
+        batch = items[start:start + batch_size]
+        crops = [crop for _, crop in batch]
+        if preprocessor is not None:
+            crops = preprocessor.process_batch(crops)
+        texts = engine.read_batch(crops)
+
+        for (window_id, _), (text, confidence) in zip(batch, texts):
+            results[window_id] = {
+                'value': parse_value(text),
+                'text': text,
+                'confidence': confidence,
+            }
+    return results
@@ -0,0 +1,90 @@
+import json
+import math
+import os
+
+import cv2
+import numpy as np
+
+# Written by model/export_onnx.py
+DEFAULT_MODEL_PATH = os.path.join(os.path.dirname(__file__), 'recognizer.int8.onnx')
+
+
+def metadata_path(model_path):
+    # recognizer.int8.onnx -> recognizer.int8.json
+    return os.path.splitext(model_path)[0] + '.json'
+
+
+def prepare_batch(crops, height, max_width=1024):
+    # Same input easyocr's recognizer gets: grayscale scaled to the model
+    # height, values in [-1, 1] and right padded by repeating the last column
+    grays = [crop if crop.ndim == 2 else cv2.cvtColor(crop, cv2.COLOR_BGR2GRAY) for crop in crops]
+    widths = [min(max_width, max(1, math.ceil(height * gray.shape[1] / gray.shape[0]))) for gray in grays]
+
+    batch = np.empty((len(grays), 1, height, max(widths)), dtype=np.float32)
+    for index, (gray, width) in enumerate(zip(grays, widths)):
+        resized = cv2.resize(gray, (width, height), interpolation=cv2.INTER_CUBIC)
+        batch[index, 0, :, :width] = resized
+        batch[index, 0, :, width:] = resized[:, width - 1:width]
+    batch *= 2.0 / 255.0
+    batch -= 1.0
+    return batch
+
+
+class OnnxRecognizer:
+    # easyocr's recognition network exported to ONNX, run with ONNX Runtime.
+    # Decoding is easyocr's greedy CTC decode with the allowlist applied to
+    # the character probabilities before picking the best one
+
+    def __init__(self, model_path=DEFAULT_MODEL_PATH, threads=1, allowlist=None):
+        import onnxruntime
+
+        with open(metadata_path(model_path)) as metadata_file:
+            metadata = json.load(metadata_file)
+        self.characters = metadata['characters']  # index 0 is the CTC blank
+        self.height = metadata['height']
+        self.ignore = np.array(metadata.get('ignore', [0]))
+
+        # Characters outside the allowlist get zero probability
+        self.allowed = np.ones(len(self.characters), dtype=bool)
+        if allowlist:
+            self.allowed[1:] = [character in allowlist for character in self.characters[1:]]
+
+        options = onnxruntime.SessionOptions()
+        # The OCR pool already runs one process per core, so each session
+        # should not spread one small batch over every core as well
+        options.intra_op_num_threads = threads
+        options.inter_op_num_threads = 1
+        options.execution_mode = onnxruntime.ExecutionMode.ORT_SEQUENTIAL
+        options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = onnxruntime.InferenceSession(model_path, sess_options=options,
+                                                    providers=['CPUExecutionProvider'])
+        self.input_name = self.session.get_inputs()[0].name
+
+    def read_batch(self, crops):
+        # Returns [(text, confidence)] for every crop
+        if not crops:
+            return []
+        logits = self.session.run(None, {self.input_name: prepare_batch(crops, self.height)})[0]
+        return self.decode(logits)
+
+    def decode(self, logits):
+        # logits are (batch, steps, characters)
+        logits = logits - logits.max(axis=2, keepdims=True)
+        probabilities = np.exp(logits)
+        probabilities *= self.allowed
+        probabilities /= probabilities.sum(axis=2, keepdims=True)
+
+        best = probabilities.argmax(axis=2)
+        best_probabilities = probabilities.max(axis=2)
+
+        texts = []
+        for indices, scores in zip(best, best_probabilities):
+            # Collapse repeats, then drop blanks and separators
+            keep = np.concatenate(([True], indices[1:] != indices[:-1])) & ~np.isin(indices, self.ignore)
+            text = ''.join(self.characters[index] for index in indices[keep])
+
+            # easyocr's confidence, a length-normalized product over non-blank steps
+            scores = scores[indices != 0]
+            confidence = float(scores.prod() ** (2.0 / math.sqrt(len(scores)))) if len(scores) else 0.0
+            texts.append((text, confidence))
+        return texts
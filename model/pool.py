@@ -0,0 +1,135 @@
+import contextlib
+import importlib.util
+import multiprocessing
+import sys
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeout
+from concurrent.futures.process import BrokenProcessPool
+
+from model import ocr
+from model.preprocess import Preprocessor
+
+
+class PoolSaturated(Exception):
+    pass
+
+
+class JobTimeout(Exception):
+    pass
+
+
+# Each worker process holds one warm engine (and its preprocessing buffers) for its whole life
+_engine = None
+_preprocessor = None
+
+
+@contextlib.contextmanager
+def _worker_main():
+    # A spawned worker re-runs the parent's __main__ module before its first
+    # job. For the server that is app.py, a whole Flask app per worker, so while
+    # workers start __main__ claims to be this module and they run it instead
+    main = sys.modules['__main__']
+    spec = getattr(main, '__spec__', None)
+    main.__spec__ = importlib.util.find_spec(__name__)
+    try:
+        yield
+    finally:
+        main.__spec__ = spec
+
+
+def _init_worker(engine_name, engine_options, preprocess_options, montage_options):
+    global _engine, _preprocessor
+    _engine = ocr.create_engine(engine_name, **engine_options)
+    if montage_options is not None:
+        _engine = ocr.MontageEngine(_engine, **montage_options)
+    if preprocess_options is not None:
+        _preprocessor = Preprocessor(**preprocess_options)
+
+
+def _ping():
+    return _engine.name
+
+
+def _read_windows(items, batch_size):
+    return ocr.read_windows(_engine, items, batch_size=batch_size, preprocessor=_preprocessor)
+
+
+def _detect(image):
+    return _engine.detect(image)
+
+
+class OCRPool:
+    def __init__(self, engine_name, size=2, queue_depth=8, timeout=10.0, batch_size=16,
+                 engine_options=None, preprocess_options=None, montage_options=None):
+        self.engine_name = engine_name
+        self.engine_options = engine_options or {}
+        self.preprocess_options = preprocess_options  # None turns preprocessing off
+        self.montage_options = montage_options  # None reads every crop on its own
+        self.size = size
+        self.queue_depth = queue_depth
+        self.timeout = timeout
+        self.batch_size = batch_size
+
+        # Jobs running plus jobs waiting, anything beyond that is rejected
+        self._slots = threading.BoundedSemaphore(size + queue_depth)
+        self._lock = threading.Lock()
+        self._executor = self._create_executor()
+
+    def _create_executor(self):
+        # Spawn instead of fork, torch does not survive being forked with threads running
+        return ProcessPoolExecutor(max_workers=self.size,
+                                   mp_context=multiprocessing.get_context('spawn'),
+                                   initializer=_init_worker,
+                                   initargs=(self.engine_name, self.engine_options, self.preprocess_options,
+                                             self.montage_options))
+
+    def start(self):
+        # Start every worker and load its engine up front, otherwise workers are
+        # spawned one by one as jobs arrive and the first jobs pay for the engine
+        # load inside their timeout
+        futures = [self._submit(_ping) for _ in range(self.size)]
+        for future in futures:
+            future.result()
+
+    def submit(self, items):
+        return self._submit_job(_read_windows, items, self.batch_size)
+
+    def submit_detect(self, image):
+        # Full frame text detection, shares the queue limit with window reads
+        return self._submit_job(_detect, image)
+
+    def _submit_job(self, fn, *args):
+        if not self._slots.acquire(blocking=False):
+            raise PoolSaturated('OCR queue is full')
+
+        try:
+            future = self._submit(fn, *args)
+        except Exception:
+            self._slots.release()
+            raise
+
+        future.add_done_callback(lambda _: self._slots.release())
+        return future
+
+    def _submit(self, fn, *args):
+        # New workers are spawned inside submit
+        with self._lock, _worker_main():
+            try:
+                return self._executor.submit(fn, *args)
+            except BrokenProcessPool:
+                # A worker died (e.g. out of memory), replace the whole pool
+                self._executor = self._create_executor()
+                return self._executor.submit(fn, *args)
+
+    def result(self, future, timeout=None):
+        timeout = timeout or self.timeout
+        try:
+            return future.result(timeout=timeout)
+        except FutureTimeout:
+            # Drop the job if it has not started, a running job keeps its slot until done
+            future.cancel()
+            raise JobTimeout(f'OCR job took longer than {timeout}s')
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
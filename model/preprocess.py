@@ -0,0 +1,66 @@
+import threading
+
+import cv2
+import numpy as np
+
+
+class Preprocessor:
+    # Turns a batch of window crops into clean dark-on-light binarized images of
+    # one fixed height. Each thread reuses the same buffers between batches, so
+    # the returned images are only valid until that thread's next call
+
+    def __init__(self, height=48, max_width=512, block_size=None, offset=8):
+        self.height = height
+        self.max_width = max_width
+        # Adaptive threshold neighbourhood (odd), it has to span a whole stroke or thick digits come out hollow
+        self.block_size = block_size or (height * 2 // 3) | 1
+        self.offset = offset
+
+        self._local = threading.local()
+
+    def _buffers(self, count):
+        # Grow the per-thread buffers only when a bigger batch shows up
+        local = self._local
+        if getattr(local, 'capacity', 0) < count:
+            local.capacity = count
+            local.gray = np.empty((count, self.height, self.max_width), dtype=np.uint8)
+            local.work = np.empty((count, self.height, self.max_width), dtype=np.float32)
+            local.binary = np.empty((count, self.height, self.max_width), dtype=np.uint8)
+        return local.gray[:count], local.work[:count], local.binary[:count]
+
+    def process_batch(self, crops):
+        if not crops:
+            return []
+        gray, work, binary = self._buffers(len(crops))
+
+        # Grayscale and scale every crop to the common height, small crops are upscaled
+        widths = []
+        for index, crop in enumerate(crops):
+            if crop.ndim == 3:
+                crop = cv2.cvtColor(crop, cv2.COLOR_BGR2GRAY)
+            height, width = crop.shape
+            width = min(self.max_width, max(1, round(width * self.height / height)))
+            interpolation = cv2.INTER_CUBIC if height < self.height else cv2.INTER_AREA
+            cv2.resize(crop, (width, self.height), dst=gray[index, :, :width], interpolation=interpolation)
+
+            # Pad by repeating the last column so it doesn't skew the statistics below
+            gray[index, :, width:] = gray[index, :, width - 1:width]
+            widths.append(width)
+
+        # Stretch each crop to the full 0-255 range
+        low = gray.min(axis=(1, 2), keepdims=True).astype(np.float32)
+        high = gray.max(axis=(1, 2), keepdims=True).astype(np.float32)
+        np.subtract(gray, low, out=work)
+        np.multiply(work, 255.0 / np.maximum(high - low, 1.0), out=work)
+
+        # Monitors mostly draw light digits on black, flip those to dark on light
+        border = (work[:, 0, :].mean(axis=1) + work[:, -1, :].mean(axis=1)) / 2
+        dark = (border < 128)[:, None, None]
+        np.subtract(255.0, work, out=work, where=dark)
+        np.copyto(gray, work, casting='unsafe')
+
+        for index in range(len(crops)):
+            cv2.adaptiveThreshold(gray[index], 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, cv2.THRESH_BINARY,
+                                  self.block_size, self.offset, dst=binary[index])
+
+        return [binary[index, :, :width] for index, width in enumerate(widths)]
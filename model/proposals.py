@@ -0,0 +1,88 @@
+import threading
+import time
+
+from model.ocr import DIGITS, parse_value
+
+
+def _overlap(first, second):
+    # Intersection over the smaller box, so a box inside another counts as a duplicate
+    left, top = max(first[0], second[0]), max(first[1], second[1])
+    right, bottom = min(first[2], second[2]), min(first[3], second[3])
+    if right <= left or bottom <= top:
+        return 0.0
+    smaller = min((first[2] - first[0]) * (first[3] - first[1]),
+                  (second[2] - second[0]) * (second[3] - second[1]))
+    return (right - left) * (bottom - top) / max(smaller, 1)
+
+
+def propose_windows(detections, frame_size, min_confidence=0.3, padding=0.2):
+    # Turn full frame detections [((left, top, right, bottom), text, confidence)]
+    # into candidate window rectangles around the numbers on the screen.
+    # Boxes are padded by a share of their height so small jitter between
+    # frames doesn't cut digits off
+    width, height = frame_size
+
+    candidates = []
+    for (left, top, right, bottom), text, confidence in detections:
+        text = text.strip()
+        value = parse_value(text)
+        if value is None or confidence < min_confidence:
+            continue
+        # Mostly digits, so labels like 'SpO2' or 'II' are left out
+        digits = sum(character in DIGITS for character in text)
+        if digits * 2 < len(text.replace(' ', '')):
+            continue
+
+        pad = round((bottom - top) * padding)
+        box = (max(0, left - pad), max(0, top - pad), min(width, right + pad), min(height, bottom + pad))
+        if box[2] - box[0] < 2 or box[3] - box[1] < 2:
+            continue
+        candidates.append((box, text, value, confidence))
+
+    # Keep the most confident of overlapping detections
+    kept = []
+    for candidate in sorted(candidates, key=lambda candidate: -candidate[3]):
+        if all(_overlap(candidate[0], other[0]) < 0.5 for other in kept):
+            kept.append(candidate)
+
+    # Reading order, top to bottom then left to right
+    kept.sort(key=lambda candidate: (candidate[0][1], candidate[0][0]))
+    return [{
+        'index': index,
+        'name': f'Window {index + 1}',
+        'top_left_x': box[0],
+        'top_left_y': box[1],
+        'bottom_right_x': box[2],
+        'bottom_right_y': box[3],
+        'text': text,
+        'value': value,
+        'confidence': confidence,
+    } for index, (box, text, value, confidence) in enumerate(kept)]
+
+
+class ProposalCache:
+    # Last proposal result per camera. Detection is only run when a user asks
+    # for proposals, frames afterwards only recognize the accepted windows
+
+    def __init__(self):
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def put(self, camera_id, frame_size, proposals):
+        entry = {
+            'camera_id': camera_id,
+            'frame': {'width': frame_size[0], 'height': frame_size[1]},
+            'proposals': proposals,
+            'created_at': time.time(),
+        }
+        with self._lock:
+            self._entries[camera_id] = entry
+        return entry
+
+    def get(self, camera_id):
+        with self._lock:
+            return self._entries.get(camera_id)
+
+    def forget(self, camera_id):
+        with self._lock:
+            self._entries.pop(camera_id, None)
@@ -0,0 +1,115 @@
+import threading
+
+import cv2
+import numpy as np
+
+# Page segmentation modes used by the tesseract engine
+PSM_SINGLE_LINE = 7  # one window crop
+PSM_SPARSE_TEXT = 11  # numbers anywhere in a full frame
+
+
+def grayscale(image):
+    # Tesseract is handed 8 bit single channel buffers, it binarizes them itself
+    gray = image if image.ndim == 2 else cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    return np.ascontiguousarray(gray, dtype=np.uint8)
+
+
+class TesseractAPI:
+    # libtesseract through tesserocr, loaded once and kept alive. A handle
+    # can't be shared between threads, so every thread gets its own per page
+    # segmentation mode, each set up with the whitelist once instead of per call
+
+    def __init__(self, lang='eng', tessdata=None, whitelist=None):
+        import tesserocr
+
+        self.tesserocr = tesserocr
+        self.lang = lang
+        self.tessdata = tessdata
+        self.whitelist = whitelist
+        self._local = threading.local()
+
+    def _api(self, psm):
+        apis = self._local.__dict__.setdefault('apis', {})
+        if psm not in apis:
+            options = {'lang': self.lang, 'psm': psm, 'oem': self.tesserocr.OEM.DEFAULT}
+            if self.tessdata:
+                options['path'] = self.tessdata
+            api = self.tesserocr.PyTessBaseAPI(**options)
+            if self.whitelist:
+                api.SetVariable('tessedit_char_whitelist', self.whitelist)
+            apis[psm] = api
+        return apis[psm]
+
+    def words(self, image, psm=PSM_SINGLE_LINE):
+        # One recognition pass straight from memory, [((left, top, right, bottom), text, confidence)]
+        gray = grayscale(image)
+        height, width = gray.shape
+
+        api = self._api(psm)
+        api.SetImageBytes(gray.tobytes(), width, height, 1, width)
+        try:
+            api.Recognize()
+            iterator = api.GetIterator()
+            if iterator is None:
+                return []
+
+            level = self.tesserocr.RIL.WORD
+            words = []
+            for word in self.tesserocr.iterate_level(iterator, level):
+                text = (word.GetUTF8Text(level) or '').strip()
+                confidence = word.Confidence(level)
+                box = word.BoundingBox(level)
+                if text and confidence >= 0 and box:
+                    words.append((tuple(box), text, confidence / 100))
+            return words
+        finally:
+            # Drops the image and results but keeps the loaded language data
+            api.Clear()
+
+    def close(self):
+        # Only the calling thread's handles, the others go with their threads
+        for api in self._local.__dict__.pop('apis', {}).values():
+            api.End()
+
+
+class TesseractCLI:
+    # Fallback through pytesseract when tesserocr isn't installed. Every call
+    # starts a tesseract process and reloads the language data, so one pass
+    # with image_to_data is all it ever runs per image
+
+    def __init__(self, lang='eng', tessdata=None, whitelist=None):
+        import pytesseract
+
+        self.pytesseract = pytesseract
+        self.lang = lang
+        self.options = ['--oem 3']
+        if tessdata:
+            self.options.append(f'--tessdata-dir "{tessdata}"')
+        if whitelist:
+            self.options.append(f'-c tessedit_char_whitelist={whitelist}')
+
+    def words(self, image, psm=PSM_SINGLE_LINE):
+        config = ' '.join(self.options + [f'--psm {psm}'])
+        data = self.pytesseract.image_to_data(grayscale(image), lang=self.lang, config=config,
+                                              output_type=self.pytesseract.Output.DICT)
+
+        words = []
+        for index, text in enumerate(data['text']):
+            # Tesseract reports -1 for layout rows that carry no text
+            confidence = float(data['conf'][index])
+            if text.strip() and confidence >= 0:
+                left, top = data['left'][index], data['top'][index]
+                box = (left, top, left + data['width'][index], top + data['height'][index])
+                words.append((box, text.strip(), confidence / 100))
+        return words
+
+    def close(self):
+        pass
+
+
+def load(lang='eng', tessdata=None, whitelist=None):
+    # In process when tesserocr is available, otherwise the command line tool
+    try:
+        return TesseractAPI(lang=lang, tessdata=tessdata, whitelist=whitelist)
+    except ImportError:
+        return TesseractCLI(lang=lang, tessdata=tessdata, whitelist=whitelist)
@@ -0,0 +1,278 @@
+import collections
+import json
+import os
+import threading
+import time
+from datetime import datetime
+
+
+def _crossed(condition, threshold, value):
+    if condition == '<':
+        return value < threshold
+    if condition == '>':
+        return value > threshold
+    if condition == '<=':
+        return value <= threshold
+    if condition == '>=':
+        return value >= threshold
+    return False
+
+
+def _cleared(condition, threshold, value, band):
+    # Back on the safe side by more than band, so a value wobbling around the
+    # threshold keeps the alert firing instead of flapping
+    if condition in ('<', '<='):
+        return value > threshold + band
+    return value < threshold - band
+
+
+class AlertTracker:
+    # Turns the alerts each frame triggers into firing and resolved
+    # transitions. An alert fires once it has been triggered for min_duration
+    # seconds without a break, and resolves once its value has stayed past the
+    # threshold by the hysteresis band (a share of the threshold) for
+    # clear_duration seconds. Frames without a value for a window change nothing
+
+    def __init__(self, min_duration=5.0, clear_duration=5.0, hysteresis=0.02):
+        self.min_duration = min_duration
+        self.clear_duration = clear_duration
+        self.hysteresis = hysteresis
+
+        self._alerts = {}  # alert_id -> state dict, only alerts triggered at some point
+        self._lock = threading.Lock()
+
+    def observe(self, readings, triggered, now=None):
+        # readings are (window_id, value) pairs and triggered the alerts
+        # AlertIndex.evaluate returned for them. Returns {window_id: {'firing': [...],
+        # 'resolved': [...]}} for the windows whose alerts changed state
+        now = time.monotonic() if now is None else now
+        values = {window_id: float(value) for window_id, value in readings if value is not None}
+        triggered_ids = {alert['alert_id'] for alert in triggered}
+
+        changes = {}
+        with self._lock:
+            for alert in triggered:
+                state = self._alerts.get(alert['alert_id'])
+                if state is None:
+                    state = self._alerts[alert['alert_id']] = {'firing': False, 'since': now}
+                state.update(window_id=alert['window_id'], condition=alert['condition'],
+                             threshold_value=alert['threshold_value'], value=alert['value'], clear_since=None)
+                if not state['firing'] and now - state['since'] >= self.min_duration:
+                    state['firing'] = True
+                    changes.setdefault(alert['window_id'], {'firing': [], 'resolved': []})['firing'].append(
+                        self._describe(alert['alert_id'], state))
+
+            for alert_id, state in list(self._alerts.items()):
+                value = values.get(state['window_id'])
+                if alert_id in triggered_ids or value is None:
+                    continue
+                state['value'] = value
+
+                if not state['firing']:
+                    # Pending alerts start over after any reading that doesn't trigger them
+                    del self._alerts[alert_id]
+                    continue
+
+                band = self.hysteresis * max(abs(state['threshold_value']), 1.0)
+                if _crossed(state['condition'], state['threshold_value'], value) or \
+                        not _cleared(state['condition'], state['threshold_value'], value, band):
+                    # Inside the band, neither triggered nor cleared
+                    state['clear_since'] = None
+                    continue
+
+                if state['clear_since'] is None:
+                    state['clear_since'] = now
+                if now - state['clear_since'] >= self.clear_duration:
+                    del self._alerts[alert_id]
+                    changes.setdefault(state['window_id'], {'firing': [], 'resolved': []})['resolved'].append(
+                        self._describe(alert_id, state))
+        return changes
+
+    def _describe(self, alert_id, state):
+        return {
+            'alert_id': alert_id,
+            'condition': state['condition'],
+            'threshold_value': state['threshold_value'],
+            'value': state['value'],
+        }
+
+    def firing(self, window_ids=None):
+        # Alerts currently firing, for the given windows (all when None)
+        with self._lock:
+            return [dict(self._describe(alert_id, state), window_id=state['window_id'])
+                    for alert_id, state in sorted(self._alerts.items())
+                    if state['firing'] and (window_ids is None or state['window_id'] in window_ids)]
+
+
+def _merge_alerts(older, newer, skip):
+    # Alerts from both lists once, newer entries win, alert ids in skip dropped
+    merged = {alert['alert_id']: alert for alert in older if alert['alert_id'] not in skip}
+    merged.update((alert['alert_id'], alert) for alert in newer)
+    return list(merged.values())
+
+
+class WebhookDispatcher:
+    # Delivers notification events to webhook URLs from background threads so
+    # frame processing never waits on HTTP. Events wait in one queue keyed by
+    # window, a newer event for a window still waiting is merged into it
+    # instead of queueing a second one. Each worker keeps a requests.Session
+    # with keep-alive connections to every target, failed deliveries are
+    # retried with exponential backoff and then appended to a JSON lines file
+
+    def __init__(self, targets, workers=2, max_pending=1000, timeout=5.0, retries=3, backoff=1.0,
+                 dead_letter_path=None):
+        self.targets = list(targets)
+        self.workers = workers
+        self.max_pending = max_pending
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.dead_letter_path = dead_letter_path
+
+        self._pending = collections.OrderedDict()  # window_id -> event
+        self._cond = threading.Condition()
+        self._dead_letter_lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._threads = []
+        self._counts = collections.Counter()
+
+    def start(self):
+        if self._threads or not self.targets:
+            return
+        self._threads = [threading.Thread(target=self._work, name=f'webhook-{index}', daemon=True)
+                         for index in range(self.workers)]
+        for thread in self._threads:
+            thread.start()
+
+    def stop(self):
+        # Events still waiting are written to the dead letter file instead of lost
+        self._stopped.set()
+        with self._cond:
+            pending = list(self._pending.values())
+            self._pending.clear()
+            self._cond.notify_all()
+        for event in pending:
+            self._dead_letter(event, None, 'stopped', 0)
+
+    @property
+    def running(self):
+        return bool(self._threads) and not self._stopped.is_set()
+
+    def submit(self, event):
+        # Queue an event, never blocks. Events have a window_id plus 'firing' and
+        # 'resolved' alert lists. The workers start with the first event
+        if not self.targets or self._stopped.is_set():
+            return
+        with self._cond:
+            if not self._threads:
+                self.start()
+            waiting = self._pending.get(event['window_id'])
+            if waiting is not None:
+                resolved_ids = {alert['alert_id'] for alert in event['resolved']}
+                firing_ids = {alert['alert_id'] for alert in event['firing']}
+                event = dict(event,
+                             firing=_merge_alerts(waiting['firing'], event['firing'], resolved_ids),
+                             resolved=_merge_alerts(waiting['resolved'], event['resolved'], firing_ids),
+                             coalesced=waiting.get('coalesced', 0) + 1)
+                self._pending[event['window_id']] = event
+                self._counts['coalesced'] += 1
+                return
+
+            if len(self._pending) >= self.max_pending:
+                self._counts['dropped'] += 1
+                self._dead_letter(event, None, 'queue full', 0)
+                return
+            self._pending[event['window_id']] = event
+            self._counts['queued'] += 1
+            self._cond.notify()
+
+    def _take(self):
+        with self._cond:
+            while not self._pending and not self._stopped.is_set():
+                self._cond.wait()
+            if self._stopped.is_set():
+                return None
+            _, event = self._pending.popitem(last=False)
+            return event
+
+    def _session(self):
+        import requests
+        from requests.adapters import HTTPAdapter
+
+        session = requests.Session()
+        # One kept-alive connection per target host is enough for one worker
+        adapter = HTTPAdapter(pool_connections=max(len(self.targets), 1), pool_maxsize=1, max_retries=0)
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        session.headers['Content-Type'] = 'application/json'
+        return session
+
+    def _work(self):
+        session = self._session()
+        try:
+            while True:
+                event = self._take()
+                if event is None:
+                    return
+                body = json.dumps(event)
+                for target in self.targets:
+                    self._deliver(session, target, event, body)
+        finally:
+            session.close()
+
+    def _deliver(self, session, target, event, body):
+        attempts = 0
+        error = 'stopped'
+        while attempts <= self.retries:
+            if attempts and self._stopped.wait(self.backoff * 2 ** (attempts - 1)):
+                break
+            attempts += 1
+            try:
+                response = session.post(target, data=body, timeout=self.timeout)
+            except Exception as e:
+                error = f'{type(e).__name__}: {e}'
+                continue
+
+            if response.status_code < 300:
+                self._count('delivered')
+                return
+            error = f'HTTP {response.status_code}'
+            # Client errors other than rate limiting won't succeed on a retry
+            if 400 <= response.status_code < 500 and response.status_code != 429:
+                break
+
+        self._count('failed')
+        self._dead_letter(event, target, error, attempts)
+
+    def _count(self, name):
+        with self._cond:
+            self._counts[name] += 1
+
+    def _dead_letter(self, event, target, error, attempts):
+        if not self.dead_letter_path:
+            print('Dropped alert notification', target, error)
+            return
+        entry = {'target': target, 'error': error, 'attempts': attempts,
+                 'failed_at': datetime.utcnow().isoformat(), 'event': event}
+        try:
+            with self._dead_letter_lock:
+                directory = os.path.dirname(self.dead_letter_path)
+                if directory:
+                    os.makedirs(directory, exist_ok=True)
+                with open(self.dead_letter_path, 'a') as dead_letter_file:
+                    dead_letter_file.write(json.dumps(entry) + '\n')
+        except OSError as e:
+            print('Failed to write alert dead letter', e)
+
+    def stats(self):
+        with self._cond:
+            return {
+                'running': self.running,
+                'targets': len(self.targets),
+                'pending': len(self._pending),
+                'queued': self._counts['queued'],
+                'coalesced': self._counts['coalesced'],
+                'delivered': self._counts['delivered'],
+                'failed': self._counts['failed'],
+                'dropped': self._counts['dropped'],
+            }
@@ -0,0 +1,47 @@
+import collections
+import threading
+
+
+class OwnershipCache:
+    # Bounded LRU of user_id -> (camera ids, window ids) so route authorization
+    # is a set lookup. loader(user_id) returns (camera_id, window_id or None) rows
+
+    def __init__(self, loader, max_users=1024):
+        self.loader = loader
+        self.max_users = max_users
+
+        self._entries = collections.OrderedDict()
+        self._generations = collections.defaultdict(int)
+        self._lock = threading.Lock()
+
+    def get(self, user_id):
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is not None:
+                self._entries.move_to_end(user_id)
+                return entry
+            generation = self._generations[user_id]
+
+        rows = self.loader(user_id)
+        entry = (frozenset(camera_id for camera_id, _ in rows),
+                 frozenset(window_id for _, window_id in rows if window_id is not None))
+
+        with self._lock:
+            # Don't cache a result that was invalidated while it was being loaded
+            if self._generations[user_id] == generation:
+                self._entries[user_id] = entry
+                self._entries.move_to_end(user_id)
+                while len(self._entries) > self.max_users:
+                    self._entries.popitem(last=False)
+        return entry
+
+    def owns_camera(self, user_id, camera_id):
+        return camera_id in self.get(user_id)[0]
+
+    def owns_window(self, user_id, window_id):
+        return window_id in self.get(user_id)[1]
+
+    def invalidate(self, user_id):
+        with self._lock:
+            self._entries.pop(user_id, None)
+            self._generations[user_id] += 1
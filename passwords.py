@@ -0,0 +1,64 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from werkzeug.security import DEFAULT_PBKDF2_ITERATIONS, check_password_hash, generate_password_hash
+
+# Werkzeug's own default work factor, never below what it stores for a bare 'pbkdf2:sha256'
+DEFAULT_METHOD = f'pbkdf2:sha256:{DEFAULT_PBKDF2_ITERATIONS}'
+
+
+def _parse_method(method):
+    # 'pbkdf2:sha256:1000000' -> (('pbkdf2', 'sha256'), (1000000,)), 'scrypt:32768:8:1' -> (('scrypt',), (32768, 8, 1))
+    parts = method.split(':')
+    return (tuple(part for part in parts if not part.isdigit()),
+            tuple(int(part) for part in parts if part.isdigit()))
+
+
+class HasherBusy(Exception):
+    pass
+
+
+class PasswordHasher:
+    # Runs password hashing on a small dedicated thread pool so a burst of logins
+    # can't take over the request workers. hashlib releases the GIL while hashing.
+    # method must spell out its work factor, e.g. 'pbkdf2:sha256:1000000', so stored
+    # hashes made with weaker parameters can be detected and upgraded
+
+    def __init__(self, method=DEFAULT_METHOD, workers=2, max_pending=16):
+        self.method = method
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='password-hasher')
+        self._slots = threading.BoundedSemaphore(workers + max_pending)
+
+    def _run(self, fn, *args):
+        if not self._slots.acquire(blocking=False):
+            raise HasherBusy('Too many password operations in progress')
+        try:
+            future = self._executor.submit(fn, *args)
+        except Exception:
+            self._slots.release()
+            raise
+
+        future.add_done_callback(lambda _: self._slots.release())
+        return future.result()
+
+    def hash(self, password):
+        return self._run(generate_password_hash, password, self.method)
+
+    def verify(self, password_hash, password):
+        return self._run(check_password_hash, password_hash, password)
+
+    def needs_rehash(self, password_hash):
+        # Werkzeug hashes look like '<method>$<salt>$<hash>'. Only a different
+        # algorithm or a lower work factor is upgraded, a hash stored with
+        # stronger parameters than configured is left alone
+        stored_name, stored_factors = _parse_method(password_hash.split('$', 1)[0])
+        name, factors = _parse_method(self.method)
+        if stored_name != name:
+            return True
+        if len(stored_factors) != len(factors):
+            # No work factor stored, it was whatever an old werkzeug defaulted to
+            return len(stored_factors) < len(factors)
+        return any(stored < wanted for stored, wanted in zip(stored_factors, factors))
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
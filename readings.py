@@ -0,0 +1,126 @@
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+# Rollup tiers kept next to the raw points
+RESOLUTIONS = {
+    '1m': timedelta(minutes=1),
+    '1h': timedelta(hours=1),
+}
+
+
+def bucket_start(timestamp, resolution):
+    if resolution == '1m':
+        return timestamp.replace(second=0, microsecond=0)
+    return timestamp.replace(minute=0, second=0, microsecond=0)
+
+
+def rollup(points):
+    # Aggregate (window_id, value, timestamp) points into
+    # {(window_id, resolution, bucket): [min, max, total, count]}
+    aggregates = {}
+    for window_id, value, timestamp in points:
+        for resolution in RESOLUTIONS:
+            key = (window_id, resolution, bucket_start(timestamp, resolution))
+            aggregate = aggregates.get(key)
+            if aggregate is None:
+                aggregates[key] = [value, value, value, 1]
+            else:
+                aggregate[0] = min(aggregate[0], value)
+                aggregate[1] = max(aggregate[1], value)
+                aggregate[2] += value
+                aggregate[3] += 1
+    return aggregates
+
+
+def parse_timestamp(text):
+    # ISO 8601 from the query string, stored timestamps are naive UTC
+    timestamp = datetime.fromisoformat(text)
+    if timestamp.tzinfo is not None:
+        timestamp = timestamp.astimezone(timezone.utc).replace(tzinfo=None)
+    return timestamp
+
+
+def pick_resolution(start, end, now, raw_retention):
+    # Short recent ranges come from raw points, longer ones from the rollups
+    span = end - start
+    if span <= timedelta(hours=1) and start >= now - raw_retention:
+        return 'raw'
+    if span <= timedelta(days=2):
+        return '1m'
+    return '1h'
+
+
+class ReadingBuffer:
+    # Holds readings in memory until there are enough of them (or they are old
+    # enough) to be written in one bulk insert
+
+    def __init__(self, max_size=500, max_age=5.0):
+        self.max_size = max_size
+        self.max_age = max_age
+
+        self._points = []
+        self._first_at = None
+        self._lock = threading.Lock()
+
+    def add(self, window_id, value, timestamp):
+        # Returns True when the buffer should be flushed
+        with self._lock:
+            if not self._points:
+                self._first_at = time.monotonic()
+            self._points.append((window_id, value, timestamp))
+            return (len(self._points) >= self.max_size or
+                    time.monotonic() - self._first_at >= self.max_age)
+
+    def drain(self):
+        with self._lock:
+            points, self._points = self._points, []
+            return points
+
+
+class ReadingFlusher:
+    # Runs task (flush the buffer, prune old rows) on one background thread
+    # every interval seconds, and right away when woken because the buffer
+    # is full. Readings of a camera that went quiet still reach the database,
+    # and frame requests never wait on the write. Starts with the first reading
+
+    def __init__(self, task, interval=5.0):
+        self.task = task
+        self.interval = interval
+
+        self._wake = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        with self._lock:
+            if self._thread is not None or self._stopped.is_set():
+                return
+            self._thread = threading.Thread(target=self._run, name='reading-flusher', daemon=True)
+            self._thread.start()
+
+    def wake(self):
+        self._wake.set()
+
+    def stop(self, timeout=None):
+        # Whatever is still buffered is left to the caller's final flush
+        self._stopped.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def _run(self):
+        while True:
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            if self._stopped.is_set():
+                return
+            try:
+                self.task()
+            except Exception as e:
+                print('Reading flush failed', e)
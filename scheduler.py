@@ -0,0 +1,151 @@
+import threading
+import time
+from collections import deque
+
+
+class SamplingScheduler:
+    # Gives every camera its own sampling interval. Cameras whose readings sit
+    # close to an alert threshold or move around a lot are sampled often,
+    # stable ones back off towards max_interval. The crops OCR'd per second
+    # across all cameras are kept under budget by stretching the intervals of
+    # the least urgent cameras first. Cameras that stop sending frames drop out
+    # after stale_after seconds so they no longer take a share of the budget
+
+    def __init__(self, min_interval=1.0, max_interval=30.0, budget=40.0,
+                 proximity_range=0.2, volatility_range=0.05, history=10, critical=0.9, stale_after=None):
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.budget = budget  # crops per second the OCR pool can spend
+        # A reading this far (relative) from a threshold or changing this much
+        # per sample no longer adds urgency
+        self.proximity_range = proximity_range
+        self.volatility_range = volatility_range
+        self.history = history
+        # Cameras at or above this urgency are never stretched for the budget
+        self.critical = critical
+        # A few of the longest intervals without a frame
+        self.stale_after = stale_after if stale_after is not None else max_interval * 3
+
+        self._cameras = {}  # camera_id -> state dict
+        self._lock = threading.Lock()
+        self.stretch = 1.0
+
+    def observe(self, camera_id, readings, margins, crops):
+        # Record one processed frame and return the camera's next interval.
+        # readings are (window_id, value) pairs, margins map window_id to the
+        # relative distance from its closest threshold (0 once triggered) and
+        # crops is how many crops this frame actually sent to OCR
+        with self._lock:
+            state = self._cameras.setdefault(camera_id, {
+                'values': {},
+                'cost': float(crops),
+                'urgency': 0.0,
+                'proximity': 0.0,
+                'volatility': 0.0,
+                'interval': self.min_interval,
+                'desired': self.min_interval,
+                'last_seen': None,
+            })
+            state['last_seen'] = time.time()
+            # Smoothed, so one frame the change gate fully skipped doesn't look free
+            state['cost'] = 0.7 * state['cost'] + 0.3 * crops
+
+            proximity = 0.0
+            volatility = 0.0
+            for window_id, value in readings:
+                if value is None:
+                    continue
+                values = state['values'].setdefault(window_id, deque(maxlen=self.history))
+                values.append(float(value))
+                volatility = max(volatility, self._volatility(values))
+
+                margin = margins.get(window_id)
+                if margin is not None:
+                    proximity = max(proximity, 1.0 - min(margin / self.proximity_range, 1.0))
+
+            state['proximity'] = proximity
+            state['volatility'] = volatility
+            state['urgency'] = max(proximity, volatility)
+            # Geometric between the bounds, urgency 0 gives max_interval and 1 gives min_interval
+            state['desired'] = self.max_interval * (self.min_interval / self.max_interval) ** state['urgency']
+
+            self._rebalance()
+            return state['interval']
+
+    def _volatility(self, values):
+        if len(values) < 2:
+            return 0.0
+        steps = [abs(current - previous) for previous, current in zip(values, list(values)[1:])]
+        scale = max(abs(sum(values) / len(values)), 1.0)
+        return min(sum(steps) / len(steps) / scale / self.volatility_range, 1.0)
+
+    def _prune(self):
+        cutoff = time.time() - self.stale_after
+        for camera_id, state in list(self._cameras.items()):
+            if state['last_seen'] < cutoff:
+                del self._cameras[camera_id]
+
+    def _rebalance(self):
+        self._prune()
+
+        # Crops per second if every camera ran at its desired interval
+        critical_demand = 0.0
+        other_demand = 0.0
+        for state in self._cameras.values():
+            demand = state['cost'] / state['desired']
+            if state['urgency'] >= self.critical:
+                critical_demand += demand
+            else:
+                other_demand += demand
+
+        # Stretch the non-critical cameras by one shared factor until they fit
+        # in what the critical ones leave over
+        spare = self.budget - critical_demand
+        if other_demand <= spare:
+            self.stretch = 1.0
+        elif spare > 0:
+            self.stretch = other_demand / spare
+        else:
+            self.stretch = float('inf')
+
+        for state in self._cameras.values():
+            if state['urgency'] >= self.critical:
+                state['interval'] = state['desired']
+            else:
+                state['interval'] = min(state['desired'] * self.stretch, self.max_interval)
+
+    def interval(self, camera_id):
+        with self._lock:
+            state = self._cameras.get(camera_id)
+            return state['interval'] if state else self.min_interval
+
+    def forget(self, camera_id):
+        with self._lock:
+            self._cameras.pop(camera_id, None)
+            self._rebalance()
+
+    def schedule(self, camera_ids=None):
+        # Current intervals and why, for the given cameras (all when None)
+        with self._lock:
+            self._rebalance()
+            cameras = []
+            for camera_id, state in sorted(self._cameras.items()):
+                if camera_ids is not None and camera_id not in camera_ids:
+                    continue
+                cameras.append({
+                    'camera_id': camera_id,
+                    'interval': round(state['interval'], 3),
+                    'urgency': round(state['urgency'], 3),
+                    'proximity': round(state['proximity'], 3),
+                    'volatility': round(state['volatility'], 3),
+                    'crops_per_frame': round(state['cost'], 3),
+                    'last_seen': state['last_seen'],
+                })
+
+            demand = sum(state['cost'] / state['interval'] for state in self._cameras.values())
+            return {
+                'budget': self.budget,
+                'demand': round(demand, 3),
+                'stretch': None if self.stretch == float('inf') else round(self.stretch, 3),
+                'cameras': cameras,
+            }
@@ -0,0 +1,65 @@
+# Local webhook receiver for trying out alert notifications. Prints every
+# POST it gets and can fail on purpose to exercise retries and the dead letter file.
+#
+#   python webhook_stub.py --port 8081
+#   ALERT_WEBHOOKS=http://127.0.0.1:8081/alerts python app.py
+#   python webhook_stub.py --fail-first 2        (first two requests answer 503)
+#   python webhook_stub.py --status 500          (every request fails)
+import argparse
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class WebhookHandler(BaseHTTPRequestHandler):
+    # HTTP/1.1 so the dispatcher's keep-alive connections are actually reused
+    protocol_version = 'HTTP/1.1'
+
+    def do_POST(self):
+        server = self.server
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+
+        with server.lock:
+            server.received += 1
+            count = server.received
+        status = server.status
+        if count <= server.fail_first:
+            status = 503
+
+        try:
+            payload = json.loads(body)
+        except ValueError:
+            payload = body.decode(errors='replace')
+        print(f'#{count} {self.path} -> {status} (connection {self.client_address[1]})')
+        print(json.dumps(payload, indent=2))
+
+        self.send_response(status)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Print alert webhook deliveries')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8081)
+    parser.add_argument('--status', type=int, default=200, help='status code to answer with')
+    parser.add_argument('--fail-first', type=int, default=0, help='answer 503 to this many requests first')
+    args = parser.parse_args()
+
+    server = ThreadingHTTPServer((args.host, args.port), WebhookHandler)
+    server.status = args.status
+    server.fail_first = args.fail_first
+    server.received = 0
+    server.lock = threading.Lock()
+    print(f'Listening on http://{args.host}:{args.port}')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    main()